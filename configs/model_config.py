@@ -42,6 +42,33 @@ def get_config() -> Dict:
         # Горизонты прогнозирования (в днях)
         'horizons': [7, 14, 21],
         
+        # Параметры MultiTargetModel
+        'fit_params': {
+            # 'highs' - отдельная LP на каждый SKU, 'irls' - пакетное обучение всех SKU,
+            # 'joint' - одна LP на все квантили SKU без пересечения квантилей
+            'solver': 'highs',
+            # Число процессов для обучения ('highs'), -1 - все ядра
+            'n_jobs': 1,
+            # Число SKU, передаваемых процессу за раз
+            'chunk_size': 16,
+            # SKU с меньшим числом ненулевых целей используют общую модель (None - отключено)
+            'pooled_min_rows': None,
+            # SKU с долей нулевых целей не меньше порога получают константную модель
+            'zero_share': 0.95,
+            # Объединять одинаковые строки в одну взвешенную перед решением LP
+            'deduplicate': True,
+            # Допустимый прирост потерь SKU на новых днях, при котором дообучение его пропускает
+            'refit_tolerance': 0.1,
+        },
+
+        # Локальный кэш разобранных заказов и таблицы продаж
+        'cache': {
+            # Каталог кэша (None - кэш отключен)
+            'cache_dir': 'data/cache',
+            # Предельный размер кэша в байтах, старые снимки удаляются (LRU)
+            'max_bytes': 4 * 2**30,
+        },
+
         # Параметры модели
         'model_params': {
             'random_state': 42,
@@ -9,6 +9,7 @@ setup(
         "numpy>=1.24.3",
         "pandas>=2.0.2",
         "scikit-learn>=1.2.2",
+        "scipy>=1.9.0",
         "fastapi>=0.95.2",
         "uvicorn>=0.22.0",
         "python-multipart>=0.0.6",
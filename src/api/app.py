@@ -1,20 +1,145 @@
+import asyncio
+import json
 import os
+import re
 import sys
+import tempfile
+from typing import BinaryIO
+from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Tuple
 
 import numpy as np
 import pandas as pd
 import uvicorn
 from fastapi import FastAPI
-from fastapi import File
-from fastapi import UploadFile
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pydantic import Field
 
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ImportError:
+    # Старые версии python-multipart ставятся как пакет multipart
+    import multipart
+    from multipart.multipart import parse_options_header
+
 PREDICTIONS_LOCAL_PATH = os.path.join(sys.path[0], "data/predictions.csv")
+PREVIOUS_PREDICTIONS_LOCAL_PATH = os.path.join(sys.path[0], "data/predictions.prev.csv")
+# Колонка прогноза: pred_{горизонт}d_q{квантиль в процентах}
+PREDICTION_COLUMN = re.compile(r"pred_(\d+)d_q(\d+)")
+# Число строк NDJSON в одном блоке потокового ответа
+STREAM_CHUNK_ROWS = 10_000
+# Поле формы с файлом прогнозов в multipart-запросе
+UPLOAD_FIELD = "file"
 
 app = FastAPI()
 predictions = None
+# Предыдущая версия прогнозов для отката
+previous_predictions = None
+# Загрузки выполняются по одной, чтобы не перепутать версии
+upload_lock = asyncio.Lock()
+
+
+class PredictionStore:
+    """
+    Predictions indexed for constant-time lookups.
+
+    All `pred_{h}d_q{q}` columns are kept in one dense float32 matrix with a
+    row per sku_id, and a hash index maps sku_id to its row.
+    """
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        """
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Predictions with a unique integer "sku_id" and numeric
+            `pred_{h}d_q{q}` columns.
+
+        Raises
+        ------
+        ValueError
+            If the predictions have no "sku_id" or prediction columns, or
+            the columns have wrong dtypes, or a sku_id is duplicated.
+        """
+        self.columns: Dict[Tuple[int, int], int] = {}
+        pred_cols = []
+        for col in df.columns:
+            match = PREDICTION_COLUMN.fullmatch(col)
+            if match:
+                self.columns[(int(match[1]), int(match[2]))] = len(pred_cols)
+                pred_cols.append(col)
+
+        if "sku_id" not in df.columns:
+            raise ValueError("Predictions have no sku_id column")
+        if not pred_cols:
+            raise ValueError("Predictions have no pred_{h}d_q{q} columns")
+        if not pd.api.types.is_integer_dtype(df["sku_id"]):
+            raise ValueError(f"sku_id must be integer, got {df['sku_id'].dtype}")
+        not_numeric = [col for col in pred_cols if not pd.api.types.is_numeric_dtype(df[col])]
+        if not_numeric:
+            raise ValueError(f"Prediction columns must be numeric: {not_numeric}")
+
+        self.index = pd.Index(df["sku_id"].to_numpy())
+        if not self.index.is_unique:
+            duplicated = self.index[self.index.duplicated()].unique()
+            raise ValueError(f"Duplicated sku_id in predictions: {duplicated[:10].tolist()}")
+        self.values = df[pred_cols].to_numpy(dtype=np.float32)
+
+    def column(self, horizon_days: int, confidence_level: float) -> int:
+        """Matrix column of the prediction for a horizon and confidence level."""
+        key = (horizon_days, int(confidence_level * 100))
+        if key not in self.columns:
+            raise KeyError(f"No predictions for {horizon_days} days and confidence {confidence_level}")
+        return self.columns[key]
+
+    def get(self, sku_id: int, horizon_days: int, confidence_level: float) -> float:
+        """Prediction of a single sku_id."""
+        column = self.column(horizon_days, confidence_level)
+        if sku_id not in self.index:
+            raise KeyError(f"No predictions for sku_id {sku_id}")
+        return float(self.values[self.index.get_loc(sku_id), column])
+
+    def rows(self, sku_ids: np.ndarray) -> np.ndarray:
+        """Matrix rows of many sku_id resolved in one vectorized lookup."""
+        rows = self.index.get_indexer(sku_ids)
+        missing = rows < 0
+        if missing.any():
+            raise KeyError(f"No predictions for sku_id {sku_ids[missing.argmax()]}")
+        return rows
+
+    def get_many(self, sku_ids: np.ndarray, horizon_days: int, confidence_level: float) -> np.ndarray:
+        """Predictions of many sku_id for a horizon and confidence level."""
+        column = self.column(horizon_days, confidence_level)
+        return self.values[self.rows(sku_ids), column]
+
+    def get_grid(self, sku_ids: np.ndarray) -> Tuple[List[int], List[int], np.ndarray]:
+        """
+        Predictions of many sku_id for all horizons and quantiles.
+
+        Returns
+        -------
+        Tuple[List[int], List[int], np.ndarray]
+            Sorted horizons, sorted quantiles in percent and predictions of
+            shape (n_skus, n_horizons, n_quantiles), NaN where a
+            (horizon, quantile) pair was not uploaded.
+        """
+        horizons = sorted({horizon for horizon, _ in self.columns})
+        quantiles = sorted({quantile for _, quantile in self.columns})
+        # Номер колонки матрицы для каждой пары (горизонт, квантиль), -1 если ее нет
+        layout = np.array([
+            [self.columns.get((horizon, quantile), -1) for quantile in quantiles]
+            for horizon in horizons
+        ], dtype=np.intp).reshape(len(horizons), len(quantiles))
+
+        grid = self.values[self.rows(sku_ids)][:, layout]
+        grid[:, layout < 0] = np.nan
+        return horizons, quantiles, grid
 
 
 class SKUInfo(BaseModel):
@@ -35,22 +160,204 @@ class LowStockSKURequest(BaseModel):
     sku_stock: List[SKUInfo] = Field(..., description="The sku and stock level.")
 
 
-@app.post("/api/predictions/upload")
-def upload_predictions(file: UploadFile = File(...)) -> dict:
-    """Upload predictions"""
-    try:
-        content = file.file.read()
-        with open(PREDICTIONS_LOCAL_PATH, "wb") as f:
-            f.write(content)
-
-        df = pd.read_csv(PREDICTIONS_LOCAL_PATH)
-
-        global predictions
-        predictions = df
-
-        return {"success": 1}
-    except Exception as e:
-        return {"success": 0, "error": str(e)}
+class BulkSKURequest(BaseModel):
+    sku_stock: List[SKUInfo] = Field(..., description="The sku and stock levels.")
+    horizon_days: int = Field(7, description="The number of days in the horizon.")
+    confidence_level: float = Field(0.1, description="The confidence level.")
+    stream: bool = Field(False, description="Stream the result as NDJSON.")
+
+
+class BulkStockRequest(BaseModel):
+    sku_stock: List[SKUInfo] = Field(..., description="The sku and stock levels.")
+
+
+def stream_ndjson(sku_ids: np.ndarray, values: np.ndarray, field: str) -> Iterator[str]:
+    """Yield {"sku_id", field} records as NDJSON in blocks of lines."""
+    for start in range(0, len(sku_ids), STREAM_CHUNK_ROWS):
+        block = zip(
+            sku_ids[start:start + STREAM_CHUNK_ROWS].tolist(),
+            values[start:start + STREAM_CHUNK_ROWS].tolist(),
+        )
+        yield "".join(
+            json.dumps({"sku_id": sku_id, field: value}) + "\n" for sku_id, value in block
+        )
+
+
+class MultipartFileWriter:
+    """
+    Write one field of a multipart/form-data body to a file as it arrives.
+
+    The body is fed in chunks to the incremental python-multipart parser;
+    only the content of the `field` part is written, nothing is buffered.
+    """
+
+    def __init__(self, f: BinaryIO, content_type: str, field: str = UPLOAD_FIELD) -> None:
+        """
+        Parameters
+        ----------
+        f : BinaryIO
+            File to write the field content to.
+        content_type : str
+            Content-Type header of the request with the boundary.
+        field : str
+            Name of the form field to write.
+
+        Raises
+        ------
+        ValueError
+            If the Content-Type has no boundary.
+        """
+        _, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if not boundary:
+            raise ValueError("Multipart boundary is missing")
+
+        self.f = f
+        self.field = field.encode()
+        self.found = False
+        self._writing = False
+        self._header_field = b""
+        self._header_value = b""
+        self.parser = multipart.MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_part_data": self._on_part_data,
+        })
+
+    def write(self, chunk: bytes) -> None:
+        """Feed the next chunk of the body."""
+        self.parser.write(chunk)
+
+    def finalize(self) -> None:
+        """Finish parsing; raises ValueError if the field was not found."""
+        self.parser.finalize()
+        if not self.found:
+            raise ValueError(f'No "{self.field.decode()}" field in the upload')
+
+    def _on_part_begin(self) -> None:
+        self._writing = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._writing = options.get(b"name") == self.field
+            self.found |= self._writing
+        self._header_field = self._header_value = b""
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writing:
+            self.f.write(data[start:end])
+
+
+async def save_upload(request: Request, f: BinaryIO) -> None:
+    """Stream the request body to a file chunk by chunk.
+
+    A multipart/form-data body is written without the form framing, any
+    other body (e.g. text/csv) is written as is.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        writer = MultipartFileWriter(f, content_type)
+        async for chunk in request.stream():
+            await run_in_threadpool(writer.write, chunk)
+        writer.finalize()
+    else:
+        async for chunk in request.stream():
+            await run_in_threadpool(f.write, chunk)
+
+
+def read_predictions(path: str) -> PredictionStore:
+    """Read and validate predictions from a CSV file"""
+    header = pd.read_csv(path, nrows=0).columns
+    pred_cols = [col for col in header if PREDICTION_COLUMN.fullmatch(col)]
+    # Читаем только нужные колонки, прогнозы сразу в float32
+    df = pd.read_csv(
+        path,
+        usecols=[col for col in header if col == "sku_id" or col in pred_cols],
+        dtype={col: np.float32 for col in pred_cols},
+    )
+    return PredictionStore(df)
+
+
+@app.post(
+    "/api/predictions/upload",
+    openapi_extra={"requestBody": {"content": {
+        "multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {UPLOAD_FIELD: {"type": "string", "format": "binary"}},
+            "required": [UPLOAD_FIELD],
+        }},
+        "text/csv": {"schema": {"type": "string", "format": "binary"}},
+    }}},
+)
+async def upload_predictions(request: Request) -> dict:
+    """Upload predictions
+
+    The body is streamed straight to disk: a multipart form with a "file"
+    field, or the CSV itself.
+    """
+    global predictions, previous_predictions
+
+    async with upload_lock:
+        tmp_path = None
+        try:
+            # Пишем тело запроса по мере получения рядом с текущим файлом,
+            # чтобы переименование было атомарным
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(PREDICTIONS_LOCAL_PATH), suffix=".csv.tmp"
+            )
+            with os.fdopen(fd, "wb") as f:
+                await save_upload(request, f)
+
+            # Разбор и проверка в отдельном потоке не блокируют остальные запросы
+            store = await run_in_threadpool(read_predictions, tmp_path)
+
+            if os.path.exists(PREDICTIONS_LOCAL_PATH):
+                os.replace(PREDICTIONS_LOCAL_PATH, PREVIOUS_PREDICTIONS_LOCAL_PATH)
+            os.replace(tmp_path, PREDICTIONS_LOCAL_PATH)
+            tmp_path = None
+
+            # Запросы видят либо старую, либо новую версию целиком
+            previous_predictions, predictions = predictions, store
+
+            return {"success": 1}
+        except Exception as e:
+            return {"success": 0, "error": str(e)}
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+@app.post("/api/predictions/rollback")
+async def rollback_predictions() -> dict:
+    """Restore the previous version of predictions"""
+    global predictions, previous_predictions
+
+    async with upload_lock:
+        try:
+            assert previous_predictions is not None, "No previous predictions"
+
+            if os.path.exists(PREVIOUS_PREDICTIONS_LOCAL_PATH):
+                # Меняем файлы местами, чтобы откат можно было отменить
+                tmp_path = PREDICTIONS_LOCAL_PATH + ".tmp"
+                os.replace(PREVIOUS_PREDICTIONS_LOCAL_PATH, tmp_path)
+                if os.path.exists(PREDICTIONS_LOCAL_PATH):
+                    os.replace(PREDICTIONS_LOCAL_PATH, PREVIOUS_PREDICTIONS_LOCAL_PATH)
+                os.replace(tmp_path, PREDICTIONS_LOCAL_PATH)
+
+            predictions, previous_predictions = previous_predictions, predictions
+
+            return {"success": 1}
+        except Exception as e:
+            return {"success": 0, "error": str(e)}
 
 
 @app.post("/api/how_much_to_order")
@@ -64,14 +371,38 @@ def how_much_to_order(request_data: SKURequest) -> dict:
 
         assert predictions is not None, "Predictions are not loaded"
 
-        pred_col = f'pred_{horizon_days}d_q{int(confidence_level * 100)}'
-        predict = predictions.loc[predictions['sku_id'] == sku_id, pred_col].values[0]
+        predict = predictions.get(sku_id, horizon_days, confidence_level)
         recommended = max(np.ceil(predict - current_stock), 0)
         return {"quantity": int(recommended)}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.post("/api/how_much_to_order/bulk")
+def how_much_to_order_bulk(request_data: BulkSKURequest):
+    """Predict how much to order for many sku"""
+    try:
+        skus = request_data.sku_stock
+
+        assert predictions is not None, "Predictions are not loaded"
+
+        sku_ids = np.array([sku.sku_id for sku in skus], dtype=np.int64)
+        stocks = np.array([sku.stock for sku in skus], dtype=np.int64)
+        predict = predictions.get_many(
+            sku_ids, request_data.horizon_days, request_data.confidence_level
+        )
+        recommended = np.maximum(np.ceil(predict - stocks), 0).astype(np.int64)
+
+        if request_data.stream:
+            return StreamingResponse(
+                stream_ndjson(sku_ids, recommended, "quantity"),
+                media_type="application/x-ndjson",
+            )
+        return {"sku_list": sku_ids.tolist(), "quantity": recommended.tolist()}
+    except Exception as e:
+        return {"error": str(e)}
+
+
 @app.post("/api/stock_level_forecast")
 def stock_level_forecast(request_data: SKURequest) -> dict:
     """Predict stock level"""
@@ -83,8 +414,7 @@ def stock_level_forecast(request_data: SKURequest) -> dict:
 
         assert predictions is not None, "Predictions are not loaded"
 
-        pred_col = f'pred_{horizon_days}d_q{int(confidence_level * 100)}'
-        predict = predictions.loc[predictions['sku_id'] == sku_id, pred_col].values[0]
+        predict = predictions.get(sku_id, horizon_days, confidence_level)
         stock_level = max(np.ceil(current_stock - predict), 0)
 
         return {"stock_forecast": int(stock_level)}
@@ -93,6 +423,35 @@ def stock_level_forecast(request_data: SKURequest) -> dict:
         return {"error": str(e)}
 
 
+@app.post("/api/stock_level_forecast/bulk")
+def stock_level_forecast_bulk(request_data: BulkStockRequest) -> dict:
+    """Predict stock levels of many sku for all horizons and confidence levels"""
+    try:
+        skus = request_data.sku_stock
+
+        assert predictions is not None, "Predictions are not loaded"
+
+        sku_ids = np.array([sku.sku_id for sku in skus], dtype=np.int64)
+        stocks = np.array([sku.stock for sku in skus], dtype=np.int64)
+        horizons, quantiles, predict = predictions.get_grid(sku_ids)
+        stock_level = np.maximum(np.ceil(stocks[:, None, None] - predict), 0)
+
+        stock_forecast = np.nan_to_num(stock_level).astype(np.int64).tolist()
+        missing = np.isnan(predict)
+        if missing.any():
+            # Пропущенные пары (горизонт, квантиль) отдаем как null
+            stock_forecast = np.where(missing, None, stock_forecast).tolist()
+
+        return {
+            "sku_list": sku_ids.tolist(),
+            "horizon_days": horizons,
+            "confidence_levels": [quantile / 100 for quantile in quantiles],
+            "stock_forecast": stock_forecast,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
 @app.post("/api/low_stock_sku_list")
 def low_stock_sku_list(request_data: LowStockSKURequest) -> dict:
     """Return sku list with low stock level"""
@@ -103,15 +462,10 @@ def low_stock_sku_list(request_data: LowStockSKURequest) -> dict:
 
         assert predictions is not None, "Predictions are not loaded"
 
-        pred_col = f'pred_{horizon_days}d_q{int(confidence_level * 100)}'
-        low_stock_list = []
-        for sku in skus:
-            sku_id = sku.sku_id
-            stock = sku.stock
-            predict = predictions.loc[predictions['sku_id'] == sku_id, pred_col].values[0]
-            if predict> stock:
-                low_stock_list.append(sku_id)
-
+        sku_ids = np.array([sku.sku_id for sku in skus], dtype=np.int64)
+        stocks = np.array([sku.stock for sku in skus], dtype=np.int64)
+        predict = predictions.get_many(sku_ids, horizon_days, confidence_level)
+        low_stock_list = sku_ids[predict > stocks].tolist()
 
         return {"sku_list": low_stock_list}
     except Exception as e:
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Размер блока при хешировании файла
+_HASH_BLOCK_SIZE = 2**20
+# Файл с описанием колонок снимка
+_META_FILE = "meta.json"
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Fingerprint of a file by its content.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+
+    Returns
+    -------
+    str
+        Hex digest of the file content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Fingerprint of a DataFrame by its columns, dtypes and values.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame to fingerprint.
+
+    Returns
+    -------
+    str
+        Hex digest of the DataFrame.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(col, str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ColumnarCache:
+    """
+    Local cache of DataFrames stored column by column in .npy files.
+
+    Every snapshot is a directory `<cache_dir>/<name>-<key>` with one file per
+    column and a JSON description of the dtypes. Snapshots are loaded with
+    memory mapping, so a cache hit costs a few file opens regardless of the
+    data size. When the total size exceeds `max_bytes`, the least recently
+    used snapshots are deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None) -> None:
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory of the cache, created if missing.
+        max_bytes : int, optional
+            Size limit of all snapshots, by default unlimited.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, name: str, key: str) -> Optional[pd.DataFrame]:
+        """Load a snapshot, or return None if it is not cached.
+
+        Parameters
+        ----------
+        name : str
+            Kind of the data, e.g. "orders" or "sales".
+        key : str
+            Fingerprint of the source data.
+
+        Returns
+        -------
+        Optional[pd.DataFrame]
+            The cached DataFrame with memory-mapped columns.
+        """
+        path = self._snapshot_path(name, key)
+        meta_path = os.path.join(path, _META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        # Время доступа в meta.json используется для LRU
+        os.utime(meta_path)
+
+        columns = {}
+        for i, column in enumerate(meta["columns"]):
+            values = np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r")
+            if column["categories"] is not None:
+                categories = pd.Index(column["categories"])
+                values = pd.Categorical.from_codes(values, categories)
+                if column["dtype"] != "category":
+                    values = pd.Series(values).astype(column["dtype"]).to_numpy()
+            columns[column["name"]] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def put(self, name: str, key: str, df: pd.DataFrame) -> None:
+        """Store a snapshot and evict old ones over the size limit.
+
+        Numeric and datetime columns are written as is, categorical and
+        string columns as integer codes with the list of categories.
+
+        Parameters
+        ----------
+        name : str
+            Kind of the data, e.g. "orders" or "sales".
+        key : str
+            Fingerprint of the source data.
+        df : pd.DataFrame
+            DataFrame to store, its index is not kept.
+        """
+        path = self._snapshot_path(name, key)
+        # Пишем во временный каталог и переименовываем, чтобы не оставить половину снимка
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            columns = []
+            for i, (col, values) in enumerate(df.items()):
+                categories = None
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    categories = values.cat.categories.tolist()
+                    data = values.cat.codes.to_numpy()
+                elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM":
+                    data = values.to_numpy()
+                else:
+                    codes, uniques = pd.factorize(values)
+                    categories = uniques.tolist()
+                    data = codes
+                np.save(os.path.join(tmp_path, f"{i}.npy"), data)
+                columns.append({"name": col, "dtype": str(values.dtype), "categories": categories})
+
+            with open(os.path.join(tmp_path, _META_FILE), "w") as f:
+                json.dump({"columns": columns, "created": time.time()}, f)
+
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """Delete the least recently used snapshots over the size limit.
+
+        Parameters
+        ----------
+        keep : str, optional
+            Path of a snapshot that is never deleted, e.g. the one just written.
+
+        Returns
+        -------
+        List[str]
+            Paths of the deleted snapshots.
+        """
+        if self.max_bytes is None:
+            return []
+
+        snapshots = []
+        for entry in os.scandir(self.cache_dir):
+            meta_path = os.path.join(entry.path, _META_FILE)
+            if entry.is_dir() and entry.path != keep and os.path.exists(meta_path):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                snapshots.append((os.stat(meta_path).st_mtime, size, entry.path))
+        snapshots.sort()
+
+        total = sum(size for _, size, _ in snapshots)
+        if keep is not None:
+            total += sum(f.stat().st_size for f in os.scandir(keep))
+        deleted = []
+        for _, size, path in snapshots:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            deleted.append(path)
+        return deleted
+
+    def _snapshot_path(self, name: str, key: str) -> str:
+        """Directory of a snapshot."""
+        return os.path.join(self.cache_dir, f"{name}-{key}")
@@ -0,0 +1,376 @@
+import warnings
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.data.cache import ColumnarCache
+from src.data.cache import file_fingerprint
+
+# Ключи дневной агрегации заказов
+DAILY_KEYS = ["day", "sku_id", "sku", "price"]
+# Число значений, по которым определяется формат времени
+_FORMAT_SAMPLE_SIZE = 1000
+# Верхние границы эпохи в секундах, мс и мкс для определения единиц
+_EPOCH_UNITS = [(1e11, "s"), (1e14, "ms"), (1e17, "us")]
+# Ширина числовых полей, которые разбираются без strptime
+_FIELD_WIDTHS = {"%Y": 4, "%m": 2, "%d": 2, "%H": 2, "%M": 2, "%S": 2}
+
+
+def download_orders(orders_url: str) -> str:
+    """
+    Download the orders file shared on Yandex Disk.
+
+    Parameters
+    ----------
+    orders_url : str
+        Public URL of the orders data on Yandex Disk.
+
+    Returns
+    -------
+    str
+        Local path of the downloaded file.
+    """
+    import requests
+    from urllib.parse import urlencode
+    from clearml import StorageManager
+
+    base_url = "https://cloud-api.yandex.net/v1/disk/public/resources/download?"
+    full_url = base_url + urlencode(dict(public_key=orders_url))
+    response = requests.get(full_url)
+    download_url = response.json()["href"]
+
+    return StorageManager.get_local_copy(remote_url=download_url)
+
+
+def source_fingerprint(orders_url: str) -> Optional[str]:
+    """
+    Fingerprint of the orders file on Yandex Disk without downloading it.
+
+    Parameters
+    ----------
+    orders_url : str
+        Public URL of the orders data on Yandex Disk.
+
+    Returns
+    -------
+    Optional[str]
+        Content hash reported by Yandex Disk, or None if it is unavailable.
+    """
+    import requests
+    from urllib.parse import urlencode
+
+    base_url = "https://cloud-api.yandex.net/v1/disk/public/resources?"
+    full_url = base_url + urlencode(dict(public_key=orders_url))
+    try:
+        response = requests.get(full_url)
+        meta = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    return meta.get("sha256") or meta.get("md5")
+
+
+def infer_timestamp_format(values: pd.Series) -> Optional[str]:
+    """
+    Infer a strftime format of day-first timestamps from a sample.
+
+    The format is guessed by pandas from the first value and accepted only if
+    it parses every value of the sample.
+
+    Parameters
+    ----------
+    values : pd.Series
+        Timestamps as strings.
+
+    Returns
+    -------
+    Optional[str]
+        The format, or None if no single format fits the sample.
+    """
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:
+        # pandas < 2.0 не экспортирует функцию публично
+        from pandas._libs.tslibs.parsing import guess_datetime_format
+
+    sample = values.dropna().head(_FORMAT_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+
+    with warnings.catch_warnings():
+        # ISO-даты разбираются без учета dayfirst, предупреждение не нужно
+        warnings.simplefilter("ignore", UserWarning)
+        timestamp_format = guess_datetime_format(str(sample.iloc[0]), dayfirst=True)
+        if timestamp_format is not None and timestamp_format.startswith("%Y"):
+            # Год в начале означает ISO-порядок, а не %Y-%d-%m
+            timestamp_format = guess_datetime_format(str(sample.iloc[0]))
+    if timestamp_format is None:
+        return None
+
+    parsed = pd.to_datetime(sample, format=timestamp_format, errors="coerce")
+    return timestamp_format if parsed.notna().all() else None
+
+
+def parse_timestamps(
+    values: pd.Series,
+    timestamp_format: Optional[str] = None,
+) -> pd.Series:
+    """
+    Parse order timestamps once with a fixed format.
+
+    Integer values are treated as Unix epoch, with the unit (s, ms, us, ns)
+    chosen by magnitude. Strings are parsed with `timestamp_format`, inferred
+    from a sample if not given; if no format fits, day-first parsing of every
+    value is used as before. Already parsed values are returned as is.
+
+    Parameters
+    ----------
+    values : pd.Series
+        Raw timestamps.
+    timestamp_format : str, optional
+        strftime format of the timestamps, by default inferred.
+
+    Returns
+    -------
+    pd.Series
+        Parsed timestamps.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_datetime(values, unit=_epoch_unit(values))
+
+    if timestamp_format is None:
+        timestamp_format = infer_timestamp_format(values)
+    if timestamp_format is None:
+        return pd.to_datetime(values, dayfirst=True)
+
+    parsed = None
+    # ISO-формат pandas разбирает своим быстрым парсером
+    if not timestamp_format.startswith("%Y-%m-%d"):
+        parsed = _parse_fixed_width(values, timestamp_format)
+    if parsed is None:
+        parsed = pd.to_datetime(values, format=timestamp_format)
+    return parsed
+
+
+def _parse_fixed_width(values: pd.Series, timestamp_format: str) -> Optional[pd.Series]:
+    """
+    Parse fixed-width numeric timestamps by reading digits from a byte matrix.
+
+    Works for formats made of %Y, %m, %d, %H, %M, %S and single-character
+    separators, when every value has exactly the width of the format.
+    Returns None if the format or any value does not fit, so the caller can
+    fall back to `pd.to_datetime`.
+    """
+    fields = {}
+    separators = []
+    width = 0
+    i = 0
+    while i < len(timestamp_format):
+        if timestamp_format[i] == "%":
+            directive = timestamp_format[i:i + 2]
+            if directive not in _FIELD_WIDTHS or directive in fields:
+                return None
+            fields[directive] = width
+            width += _FIELD_WIDTHS[directive]
+            i += 2
+        else:
+            separators.append((width, ord(timestamp_format[i])))
+            width += 1
+            i += 1
+    if not {"%Y", "%m", "%d"} <= fields.keys() or values.empty or values.isna().any():
+        return None
+
+    try:
+        raw = np.asarray(values, dtype="S")
+    except UnicodeEncodeError:
+        return None
+    if raw.dtype.itemsize != width:
+        return None
+    # Короткие строки дополнены нулевыми байтами и не пройдут проверку цифр
+    chars = raw.view(np.uint8).reshape(len(raw), width)
+    if any((chars[:, pos] != char).any() for pos, char in separators):
+        return None
+
+    numbers = {}
+    for directive, offset in fields.items():
+        digits = chars[:, offset:offset + _FIELD_WIDTHS[directive]].astype(np.int64) - ord("0")
+        if ((digits < 0) | (digits > 9)).any():
+            return None
+        numbers[directive] = digits @ 10 ** np.arange(digits.shape[1] - 1, -1, -1)
+
+    zeros = np.zeros(len(raw), dtype=np.int64)
+    hours, minutes, seconds = (numbers.get(key, zeros) for key in ("%H", "%M", "%S"))
+    months = (numbers["%Y"] - 1970) * 12 + numbers["%m"] - 1
+    month_start = months.astype("datetime64[M]").astype("datetime64[D]")
+    month_days = ((months + 1).astype("datetime64[M]").astype("datetime64[D]") - month_start).astype(int)
+    valid = (
+        (numbers["%m"] >= 1) & (numbers["%m"] <= 12)
+        & (numbers["%d"] >= 1) & (numbers["%d"] <= month_days)
+        & (hours < 24) & (minutes < 60) & (seconds < 60)
+    )
+    if not valid.all():
+        return None
+
+    seconds_total = ((numbers["%d"] - 1) * 24 + hours) * 3600 + minutes * 60 + seconds
+    timestamps = month_start.astype("datetime64[s]") + seconds_total.astype("timedelta64[s]")
+
+    # Единицы результата берем у pandas, разобрав первое значение
+    dtype = pd.to_datetime(values.iloc[:1], format=timestamp_format).dtype
+    return pd.Series(timestamps.astype(dtype), index=values.index, name=values.name)
+
+
+def _epoch_unit(values: pd.Series) -> str:
+    """Unit of integer epoch timestamps by their magnitude."""
+    magnitude = np.abs(values).max() if len(values) else 0
+    for bound, unit in _EPOCH_UNITS:
+        if magnitude < bound:
+            return unit
+    return "ns"
+
+
+def aggregate_daily(df_orders: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate orders into daily sales.
+
+    Parameters
+    ----------
+    df_orders : pd.DataFrame
+        Orders with parsed "timestamp", "sku_id", "sku", "price" and "qty".
+
+    Returns
+    -------
+    pd.DataFrame
+        Total "qty" per ("day", "sku_id", "sku", "price"), sorted by these keys.
+    """
+    days = df_orders["timestamp"].dt.floor("D").rename("day")
+    keys = [days] + [df_orders[col] for col in DAILY_KEYS[1:]]
+    return df_orders["qty"].groupby(keys, observed=True).sum().reset_index()
+
+
+def read_orders(
+    path: str,
+    chunksize: Optional[int] = None,
+    timestamp_format: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Read the orders CSV.
+
+    Timestamps are parsed once, with a fixed format (see `parse_timestamps`).
+
+    Parameters
+    ----------
+    path : str
+        Local path of the orders CSV.
+    chunksize : int, optional
+        When set, the file is read in chunks of this many rows and each chunk
+        is aggregated into daily sales right away, so memory is bounded by the
+        size of the daily aggregate instead of the raw order log.
+        By default the whole file is read as is.
+    timestamp_format : str, optional
+        strftime format of the "timestamp" column, by default inferred from
+        the first rows.
+
+    Returns
+    -------
+    pd.DataFrame
+        Raw orders if `chunksize` is None, otherwise daily sales in the
+        `aggregate_daily` format.
+    """
+    if chunksize is None:
+        df_orders = pd.read_csv(path)
+        df_orders["timestamp"] = parse_timestamps(df_orders["timestamp"], timestamp_format)
+        return df_orders
+
+    daily = None
+    parts: List[pd.DataFrame] = []
+    n_pending = 0
+    reader = pd.read_csv(
+        path,
+        usecols=["timestamp"] + DAILY_KEYS[1:] + ["qty"],
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        if timestamp_format is None and not pd.api.types.is_integer_dtype(chunk["timestamp"]):
+            # Формат определяем один раз по первому фрагменту
+            timestamp_format = infer_timestamp_format(chunk["timestamp"])
+        chunk["timestamp"] = parse_timestamps(chunk["timestamp"], timestamp_format)
+        part = aggregate_daily(chunk)
+        parts.append(part)
+        n_pending += len(part)
+        # Сливаем частичные агрегаты, когда они сравнялись по размеру с общим:
+        # суммарная стоимость слияний линейна по числу строк агрегатов
+        if daily is None or n_pending >= len(daily):
+            daily = _merge_daily(([daily] if daily is not None else []) + parts)
+            parts, n_pending = [], 0
+
+    if daily is None:
+        return pd.DataFrame(columns=DAILY_KEYS + ["qty"])
+    if parts:
+        daily = _merge_daily([daily] + parts)
+    return daily
+
+
+def _merge_daily(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """Sum partial daily aggregates over the same keys."""
+    if len(parts) == 1:
+        return parts[0]
+    df = pd.concat(parts, ignore_index=True)
+    return df.groupby(DAILY_KEYS, observed=True)["qty"].sum().reset_index()
+
+
+def load_orders(
+    orders_url: str,
+    chunksize: Optional[int] = None,
+    cache: Optional[Dict] = None,
+) -> pd.DataFrame:
+    """
+    Download and read the orders, reusing a cached snapshot when possible.
+
+    The snapshot is keyed by the content hash of the source: the hash reported
+    by Yandex Disk if available (a cache hit then skips the download), or
+    the hash of the downloaded file.
+
+    Parameters
+    ----------
+    orders_url : str
+        Public URL of the orders data on Yandex Disk.
+    chunksize : int, optional
+        Passed to `read_orders`.
+    cache : Dict, optional
+        `ColumnarCache` parameters; no caching if None or "cache_dir" is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        Orders in the `read_orders` format. With caching, `attrs["source_key"]`
+        identifies the source and the read mode.
+    """
+    if not cache or cache.get("cache_dir") is None:
+        return read_orders(download_orders(orders_url), chunksize=chunksize)
+
+    store = ColumnarCache(**cache)
+    # Сырые заказы и дневные агрегаты храним как разные снимки
+    name = "orders" if chunksize is None else "daily"
+
+    local_path = None
+    key = source_fingerprint(orders_url)
+    if key is None:
+        local_path = download_orders(orders_url)
+        key = file_fingerprint(local_path)
+
+    df_orders = store.get(name, key)
+    if df_orders is not None:
+        print(f"Orders loaded from cache {store.cache_dir}")
+    else:
+        if local_path is None:
+            local_path = download_orders(orders_url)
+        df_orders = read_orders(local_path, chunksize=chunksize)
+        store.put(name, key, df_orders)
+
+    # Ключ источника и режима чтения, по нему кэшируются производные таблицы
+    df_orders.attrs["source_key"] = f"{name}-{key}"
+    return df_orders
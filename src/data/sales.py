@@ -0,0 +1,285 @@
+import os
+import pickle
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.data.cache import ColumnarCache
+from src.data.cache import frame_fingerprint
+from src.data.ingestion import DAILY_KEYS
+from src.data.ingestion import parse_timestamps
+from src.data.schema import compact_dtypes
+
+
+def build_sales(df_orders: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build the dense daily sales grid from the orders.
+
+    The grid has one row per sku_id and day between the first and the last
+    day of the orders. Days without orders get zero "qty"; their "sku" and
+    "price" are carried forward from the last day with orders of the sku_id,
+    or back-filled from its first day with orders.
+
+    Parameters
+    ----------
+    df_orders : pd.DataFrame
+        Raw orders with "timestamp", or daily sales from `read_orders`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Sales grid with "day", "sku_id", "sku", "price" and "qty" in compact
+        dtypes, sorted by sku_id and day.
+    """
+    daily = _daily_totals(df_orders)
+    days = pd.date_range(daily["day"].min(), daily["day"].max(), freq="D")
+    df_sales = _fill_grid(daily, np.unique(daily["sku_id"]), days)
+    return compact_dtypes(df_sales)
+
+
+def update_sales(df_sales: pd.DataFrame, df_orders: pd.DataFrame) -> pd.DataFrame:
+    """
+    Append the days after the end of a sales grid.
+
+    Days before the last day of the grid are final: only orders from its
+    last day on are aggregated. The last day is aggregated again, since the
+    previous run may have seen only a part of it. sku_id without sales
+    before the last day are rebuilt from all their orders, so that "sku" and
+    "price" back-filled into their zero history match their first day with
+    orders. The result is identical to `build_sales` over all orders, as
+    long as `df_orders` has all orders from the last day of the grid on.
+
+    Parameters
+    ----------
+    df_sales : pd.DataFrame
+        Sales grid built by `build_sales` or `update_sales`.
+    df_orders : pd.DataFrame
+        Orders in the `build_sales` format, may include already processed days.
+
+    Returns
+    -------
+    pd.DataFrame
+        Updated sales grid.
+    """
+    last_day = df_sales["day"].max()
+    daily = _daily_totals(df_orders, since=last_day)
+    if daily.empty:
+        return df_sales
+
+    # Последний день сетки мог быть загружен не полностью, собираем его заново
+    df_kept = df_sales[df_sales["day"] < last_day]
+    sold = df_kept[df_kept["qty"] > 0]["sku_id"].unique()
+    # sku_id без продаж до последнего дня пересобираем по всем их заказам
+    rebuild_ids = np.setdiff1d(daily["sku_id"].unique(), sold)
+    df_kept = df_kept[~df_kept["sku_id"].isin(rebuild_ids)]
+    known_ids = np.sort(df_kept["sku_id"].unique())
+
+    parts = [df_kept]
+    if len(known_ids):
+        days = pd.date_range(last_day, daily["day"].max(), freq="D")
+        # Продолжаем sku и price последней строки каждого известного sku_id
+        carry = df_kept.groupby("sku_id", observed=True)[["sku", "price"]].last()
+        daily_known = daily[daily["sku_id"].isin(known_ids)]
+        parts.append(_fill_grid(daily_known, known_ids, days, carry=carry))
+    if len(rebuild_ids):
+        all_days = pd.date_range(df_sales["day"].min(), daily["day"].max(), freq="D")
+        daily_rebuilt = _daily_totals(df_orders[df_orders["sku_id"].isin(rebuild_ids)])
+        parts.append(_fill_grid(daily_rebuilt, rebuild_ids, all_days))
+
+    # Общий список категорий sku, чтобы concat не превратил колонку в строки
+    categories = pd.Index(np.concatenate([
+        pd.Categorical(part["sku"]).categories.to_numpy() for part in parts
+    ]))
+    sku_dtype = pd.CategoricalDtype(categories.unique().sort_values())
+    df_sales = pd.concat([part.astype({"sku": sku_dtype}) for part in parts], ignore_index=True)
+    order = np.lexsort((df_sales["day"].to_numpy(), df_sales["sku_id"].to_numpy()))
+    df_sales = df_sales.take(order).reset_index(drop=True)
+    return compact_dtypes(df_sales.astype({"qty": int}))
+
+
+def load_sales(
+    df_orders: pd.DataFrame,
+    cache: Optional[Dict] = None,
+    sales_path: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Build the sales grid, reusing a cached snapshot or a previous grid.
+
+    A snapshot in the cache is returned as is. It is keyed by the source
+    key that `load_orders` puts into `df_orders.attrs`, or by a hash of
+    `df_orders` if there is none. Otherwise the grid pickled
+    at `sales_path` is extended with `update_sales`, or a new grid is built
+    with `build_sales`; the result is pickled back and cached.
+
+    Parameters
+    ----------
+    df_orders : pd.DataFrame
+        Orders in the `build_sales` format.
+    cache : Dict, optional
+        `ColumnarCache` parameters; no caching if None or "cache_dir" is None.
+    sales_path : str, optional
+        Pickle of the sales grid kept between runs; not used if None.
+
+    Returns
+    -------
+    pd.DataFrame
+        Sales grid in the `build_sales` format.
+    """
+    store = key = None
+    if cache and cache.get("cache_dir") is not None:
+        store = ColumnarCache(**cache)
+        # Ключ источника от load_orders не требует хешировать все заказы
+        key = df_orders.attrs.get("source_key") or frame_fingerprint(df_orders)
+        df_sales = store.get("sales", key)
+        if df_sales is not None:
+            print(f"Sales loaded from cache {store.cache_dir}")
+            return df_sales
+
+    if sales_path and os.path.exists(sales_path):
+        with open(sales_path, "rb") as f:
+            df_sales = pickle.load(f)
+        print(f"Appending days after {df_sales['day'].max()} to sales data...")
+        df_sales = update_sales(df_sales, df_orders)
+    else:
+        df_sales = build_sales(df_orders)
+
+    if sales_path:
+        with open(sales_path, "wb") as f:
+            pickle.dump(df_sales, f)
+    if store is not None:
+        store.put("sales", key, df_sales)
+    return df_sales
+
+
+def _daily_totals(
+    df_orders: pd.DataFrame,
+    since: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    """
+    Total daily qty of every sku_id, starting from `since` if given.
+
+    A sku_id sold at several prices during a day gets a single row with the
+    total qty and the greatest of its ("sku", "price") pairs.
+
+    Returns
+    -------
+    pd.DataFrame
+        "sku_id", "day", "sku", "price" and "qty", sorted by sku_id and day.
+    """
+    if "timestamp" not in df_orders.columns:
+        # Заказы уже агрегированы по дням при потоковом чтении
+        daily = df_orders if since is None else df_orders[df_orders["day"] >= since]
+        return (
+            daily.groupby(["sku_id", "day"], observed=True)
+            .agg(sku=("sku", "last"), price=("price", "last"), qty=("qty", "sum"))
+            .reset_index()
+        )
+
+    # Время уже разобрано при чтении, parse_timestamps его не трогает
+    timestamps = parse_timestamps(df_orders["timestamp"])
+    keep = timestamps.notna() & df_orders[DAILY_KEYS[1:]].notna().all(axis=1)
+    if since is not None:
+        keep &= timestamps >= since
+    keep = keep.to_numpy()
+    if not keep.any():
+        return pd.DataFrame(columns=["sku_id", "day", "sku", "price", "qty"])
+
+    days = timestamps.to_numpy()[keep].astype("datetime64[D]")
+    first_day = days.min()
+    day_codes = (days - first_day).astype(np.int64)
+    n_days = int(day_codes.max()) + 1
+    sku_codes, sku_ids = pd.factorize(df_orders["sku_id"].to_numpy()[keep], sort=True)
+    name_codes, names = pd.factorize(df_orders["sku"].to_numpy()[keep], sort=True)
+    price_codes, prices = pd.factorize(df_orders["price"].to_numpy()[keep], sort=True)
+
+    # Ячейка (sku_id, день) плоской матрицы и номер пары (sku, price) в порядке сортировки
+    cells = sku_codes.astype(np.int64) * n_days + day_codes
+    pairs = name_codes.astype(np.int64) * len(prices) + price_codes
+    n_cells = len(sku_ids) * n_days
+
+    qty = np.bincount(
+        cells,
+        weights=np.nan_to_num(df_orders["qty"].to_numpy(dtype=float)[keep]),
+        minlength=n_cells,
+    )
+    last_pair = np.full(n_cells, -1, dtype=np.int64)
+    np.maximum.at(last_pair, cells, pairs)
+
+    occupied = np.flatnonzero(np.bincount(cells, minlength=n_cells))
+    occupied_pairs = last_pair[occupied]
+    return pd.DataFrame({
+        "sku_id": np.asarray(sku_ids)[occupied // n_days],
+        "day": (first_day + occupied % n_days).astype(timestamps.dtype),
+        "sku": np.asarray(names, dtype=object)[occupied_pairs // len(prices)],
+        "price": np.asarray(prices)[occupied_pairs % len(prices)],
+        "qty": qty[occupied].astype(np.int64),
+    })
+
+
+def _fill_grid(
+    daily: pd.DataFrame,
+    sku_ids: np.ndarray,
+    days: pd.DatetimeIndex,
+    carry: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Expand daily totals into the dense (sku_id x day) grid without joins.
+
+    sku_id and day of every daily row are turned into integer matrix
+    coordinates, "qty" is scattered into a preallocated (n_skus, n_days)
+    array, and "sku" and "price" of every cell are looked up by the index of
+    the daily row to carry forward, found with a running maximum.
+
+    Parameters
+    ----------
+    daily : pd.DataFrame
+        Output of `_daily_totals`.
+    sku_ids : np.ndarray
+        Sorted sku_id of the grid.
+    days : pd.DatetimeIndex
+        Days of the grid.
+    carry : pd.DataFrame, optional
+        "sku" and "price" indexed by sku_id to carry into the first day of the
+        grid, e.g. from the last day of a previous grid.
+
+    Returns
+    -------
+    pd.DataFrame
+        Grid sorted by sku_id and day.
+    """
+    n_skus, n_days = len(sku_ids), len(days)
+    rows = np.searchsorted(sku_ids, daily["sku_id"].to_numpy())
+    cols = (daily["day"].to_numpy() - days[0].to_datetime64()) // np.timedelta64(1, "D")
+
+    qty = np.zeros((n_skus, n_days), dtype=np.int64)
+    qty[rows, cols] = daily["qty"].to_numpy()
+
+    skus = daily["sku"].to_numpy(dtype=object)
+    prices = daily["price"].to_numpy(dtype=float)
+    # Номер строки daily для каждой ячейки; столбец 0 - значения из carry
+    source = np.full((n_skus, n_days + 1), -1, dtype=np.intp)
+    source[rows, cols + 1] = np.arange(len(daily))
+    if carry is not None:
+        previous = carry.reindex(sku_ids)
+        known = previous["sku"].notna().to_numpy()
+        source[known, 0] = len(skus) + np.arange(known.sum())
+        skus = np.concatenate((skus, previous["sku"].to_numpy(dtype=object)[known]))
+        prices = np.concatenate((prices, previous["price"].to_numpy(dtype=float)[known]))
+
+    # Протягиваем последнюю заполненную ячейку вперед, до первой - назад
+    filled = source >= 0
+    last = np.maximum.accumulate(np.where(filled, np.arange(n_days + 1), -1), axis=1)
+    last = np.where(last >= 0, last, filled.argmax(axis=1)[:, None])
+    cells = np.take_along_axis(source, last, axis=1)[:, 1:].ravel()
+    # sku сразу собираем категориальным, не создавая строку на каждую ячейку
+    sku_codes, sku_names = pd.factorize(skus, sort=True)
+
+    return pd.DataFrame({
+        "day": np.tile(days.to_numpy(), n_skus),
+        "sku_id": np.repeat(sku_ids, n_days),
+        "sku": pd.Categorical.from_codes(sku_codes[cells], categories=sku_names),
+        "price": prices[cells],
+        "qty": qty.ravel(),
+    })
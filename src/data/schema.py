@@ -0,0 +1,80 @@
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Компактные типы колонок таблицы продаж
+SALES_DTYPES = {
+    "sku_id": "int32",
+    "sku": "category",
+    "price": "float32",
+    "qty": "int32",
+}
+# Тип колонок признаков и целей
+FEATURE_DTYPE = "float32"
+
+
+def compact_dtypes(
+    df: pd.DataFrame,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Downcast columns of the DataFrame to compact dtypes.
+
+    Integer columns are downcast only if all their values fit into the
+    target dtype, otherwise they are left as is. Columns missing from the
+    DataFrame are skipped.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame to downcast.
+    dtypes : Dict[str, str], optional
+        Target dtype of each column, by default `SALES_DTYPES`.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with downcasted columns.
+    """
+    if dtypes is None:
+        dtypes = SALES_DTYPES
+
+    casts = {}
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype != "category" and np.issubdtype(np.dtype(dtype), np.integer):
+            info = np.iinfo(dtype)
+            values = df[col]
+            if values.isna().any() or len(values) and (
+                values.min() < info.min or values.max() > info.max
+            ):
+                continue
+        casts[col] = dtype
+    return df.astype(casts) if casts else df
+
+
+def report_memory(df: pd.DataFrame, stage: str) -> int:
+    """
+    Print the memory footprint of the DataFrame at a pipeline stage.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame to measure.
+    stage : str
+        Name of the pipeline stage.
+
+    Returns
+    -------
+    int
+        Size of the DataFrame in bytes, including object columns.
+    """
+    nbytes = int(df.memory_usage(deep=True).sum())
+    print(
+        f"Memory at {stage}: {nbytes / 2**20:.1f} MiB "
+        f"({nbytes / max(len(df), 1):.0f} bytes per row, shape {df.shape})"
+    )
+    return nbytes
@@ -0,0 +1,247 @@
+import pickle
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.features.engineering import interpolate_quantiles
+
+
+class FeatureStore:
+    """
+    Persistent per-SKU state of rolling features for daily inference.
+
+    The store keeps the last `max(days)` values of every aggregated column
+    for each sku_id together with running window sums, so a new day of sales
+    updates the features in O(window) per SKU instead of recomputing them
+    over the whole history.
+
+    Feature rows produced after `rebuild` and after a sequence of `append_day`
+    calls are identical, and match the last day of `add_features` computed on
+    the dense (day x sku_id) sales grid.
+    """
+
+    def __init__(self, features: Dict[str, Tuple[str, int, str, Optional[int]]]) -> None:
+        """
+        Parameters
+        ----------
+        features : Dict[str, Tuple[str, int, str, Optional[int]]]
+            Feature configuration in the `add_features` format.
+
+        Attributes
+        ----------
+        day_ : pd.Timestamp
+            Last ingested day.
+        n_days_ : int
+            Number of ingested days (capped by the window length).
+        sku_ids_ : np.ndarray
+            Known sku_id values, one per state row.
+        static_ : pd.DataFrame
+            Last known "sku" and "price" of each sku_id.
+        dtypes_ : dict
+            Dtypes of the aggregated columns in the sales grid.
+        history_ : Dict[str, np.ndarray]
+            Last `window` values of every aggregated column, shape
+            (n_skus, window). Days before the start of history are NaN.
+        sums_ : Dict[Tuple[str, int], np.ndarray]
+            Running sums (NaN counted as 0) over the last N days.
+        nans_ : Dict[Tuple[str, int], np.ndarray]
+            Running counts of NaN values over the last N days.
+
+        Raises
+        ------
+        ValueError
+            If aggregation_function is not one of the following: "quantile", "avg"
+        """
+        for agg_col, days, agg_func, quantile in features.values():
+            if agg_func not in ("quantile", "avg"):
+                raise ValueError(f"Unknown aggregation function: {agg_func}")
+
+        self.features = features
+        self.columns = list(dict.fromkeys(agg_col for agg_col, *_ in features.values()))
+        self.windows = sorted({(agg_col, days) for agg_col, days, *_ in features.values()})
+        self.window = max(days for _, days in self.windows)
+
+        self.day_ = None
+        self.n_days_ = 0
+        self.sku_ids_ = np.array([], dtype=int)
+        self.static_ = pd.DataFrame(columns=["sku", "price"])
+        self.dtypes_ = {}
+        self.history_ = {}
+        self.sums_ = {}
+        self.nans_ = {}
+
+    def rebuild(self, df_sales: pd.DataFrame) -> "FeatureStore":
+        """Build the state from the full sales history.
+
+        Parameters
+        ----------
+        df_sales : pd.DataFrame
+            Dense sales grid with "day", "sku_id", "sku", "price" and the
+            aggregated columns, one row per (sku_id, day).
+
+        Returns
+        -------
+        FeatureStore
+            The store itself.
+        """
+        df = df_sales.sort_values(["sku_id", "day"], kind="stable")
+        tail = df.groupby("sku_id").tail(self.window)
+
+        codes, sku_ids = pd.factorize(tail["sku_id"], sort=True)
+        self.sku_ids_ = np.asarray(sku_ids)
+        sizes = np.bincount(codes, minlength=len(self.sku_ids_))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        # Выравниваем историю по правому краю окна
+        cols = np.arange(len(codes)) - starts[codes] + (self.window - sizes[codes])
+
+        for col in self.columns:
+            history = np.full((len(self.sku_ids_), self.window), np.nan)
+            history[codes, cols] = tail[col].to_numpy(dtype=float)
+            self.history_[col] = history
+
+        # sku храним как object, чтобы в append_day можно было добавить новые названия
+        self.static_ = tail.groupby("sku_id")[["sku", "price"]].last().astype({"sku": object})
+        self.dtypes_ = tail.dtypes[self.columns].to_dict()
+        self.day_ = pd.Timestamp(df["day"].max())
+        self.n_days_ = min(df["day"].nunique(), self.window)
+        self._reset_sums()
+        return self
+
+    def append_day(self, df_day: pd.DataFrame) -> "FeatureStore":
+        """Ingest sales of the day following `day_`, or re-ingest `day_` itself.
+
+        sku_id missing from `df_day` get zero sales for the day; new sku_id get
+        a history back-filled with zeros, as in the dense sales grid.
+
+        Sales of `day_` replace the stored ones, so a day ingested before all
+        its orders arrived is completed by ingesting it again.
+
+        Parameters
+        ----------
+        df_day : pd.DataFrame
+            Sales of a single day in the `rebuild` format.
+
+        Returns
+        -------
+        FeatureStore
+            The store itself.
+
+        Raises
+        ------
+        ValueError
+            If the store is empty or `df_day` is neither `day_` nor the day
+            following it.
+        """
+        if self.day_ is None:
+            raise ValueError("Feature store is empty, rebuild it first")
+        next_day = self.day_ + pd.Timedelta(days=1)
+        day_values = pd.to_datetime(df_day["day"]).unique()
+        if len(day_values) != 1 or pd.Timestamp(day_values[0]) not in (self.day_, next_day):
+            raise ValueError(f"Expected sales of {self.day_} or {next_day}, got {day_values}")
+
+        self._add_skus(df_day["sku_id"].unique())
+        rows = np.searchsorted(self.sku_ids_, df_day["sku_id"].to_numpy())
+
+        if pd.Timestamp(day_values[0]) == self.day_:
+            # Перезаписываем последний день и пересчитываем суммы окон по истории
+            for col in self.columns:
+                incoming = np.zeros(len(self.sku_ids_))
+                incoming[rows] = df_day[col].to_numpy(dtype=float)
+                self.history_[col][:, -1] = incoming
+            self._reset_sums()
+            self._update_static(df_day)
+            return self
+
+        for col in self.columns:
+            history = self.history_[col]
+            incoming = np.zeros(len(self.sku_ids_))
+            incoming[rows] = df_day[col].to_numpy(dtype=float)
+
+            for agg_col, days in self.windows:
+                if agg_col != col:
+                    continue
+                outgoing = history[:, self.window - days]
+                self.sums_[(col, days)] += np.nan_to_num(incoming) - np.nan_to_num(outgoing)
+                self.nans_[(col, days)] += np.isnan(incoming).astype(int) - np.isnan(outgoing)
+
+            history[:, :-1] = history[:, 1:]
+            history[:, -1] = incoming
+
+        self._update_static(df_day)
+        self.day_ = next_day
+        self.n_days_ = min(self.n_days_ + 1, self.window)
+        return self
+
+    def to_frame(self) -> pd.DataFrame:
+        """Feature rows of the last ingested day.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per sku_id with "day", "sku_id", "sku", "price", the
+            aggregated columns and the configured features, sorted by sku_id.
+        """
+        df = pd.DataFrame({"day": self.day_, "sku_id": self.sku_ids_})
+        df["sku"] = self.static_["sku"].to_numpy()
+        df["price"] = self.static_["price"].to_numpy()
+        for col in self.columns:
+            if col not in df.columns:
+                df[col] = self.history_[col][:, -1].astype(self.dtypes_[col])
+
+        sorted_windows = {}
+        for feature_name, (agg_col, days, agg_func, quantile) in self.features.items():
+            has_nan = self.nans_[(agg_col, days)] > 0
+            if agg_func == "avg":
+                values = self.sums_[(agg_col, days)] / days
+            else:
+                if (agg_col, days) not in sorted_windows:
+                    window = self.history_[agg_col][:, self.window - days:]
+                    sorted_windows[(agg_col, days)] = np.sort(window, axis=1)
+                values, = interpolate_quantiles(sorted_windows[(agg_col, days)], [quantile / 100])
+            df[feature_name] = np.where(has_nan, np.nan, values)
+        return df
+
+    def save(self, path: str) -> None:
+        """Save the store to disk."""
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str) -> "FeatureStore":
+        """Load a store saved with `save`."""
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _update_static(self, df_day: pd.DataFrame) -> None:
+        """Take "sku" and "price" of the sku_id sold on the day."""
+        static = df_day.drop_duplicates("sku_id", keep="last").set_index("sku_id")
+        self.static_.loc[static.index, ["sku", "price"]] = static[["sku", "price"]].values
+
+    def _add_skus(self, sku_ids: np.ndarray) -> None:
+        """Add unknown sku_id with a zero history over the ingested days."""
+        new_ids = np.setdiff1d(sku_ids, self.sku_ids_)
+        if len(new_ids) == 0:
+            return
+
+        sku_ids = np.concatenate((self.sku_ids_, new_ids))
+        order = np.argsort(sku_ids, kind="stable")
+        self.sku_ids_ = sku_ids[order]
+
+        empty = np.full((len(new_ids), self.window), np.nan)
+        empty[:, self.window - self.n_days_:] = 0
+        for col in self.columns:
+            self.history_[col] = np.concatenate((self.history_[col], empty))[order]
+
+        new_static = pd.DataFrame(index=pd.Index(new_ids, name="sku_id"), columns=["sku", "price"])
+        self.static_ = pd.concat([self.static_, new_static]).iloc[order]
+        self._reset_sums()
+
+    def _reset_sums(self) -> None:
+        """Recompute running window sums from the stored history."""
+        for col, days in self.windows:
+            window = self.history_[col][:, self.window - days:]
+            self.sums_[(col, days)] = np.nansum(window, axis=1)
+            self.nans_[(col, days)] = np.isnan(window).sum(axis=1)
@@ -0,0 +1,117 @@
+from typing import Optional
+
+import numpy as np
+
+# Нижняя граница модуля остатка в весах IRLS
+_RESIDUAL_EPS = 1e-6
+# Относительная регуляризация нормальных уравнений (вырожденные признаки)
+_RIDGE = 1e-10
+
+
+def fit_quantile_regression(
+    X: np.ndarray,
+    y: np.ndarray,
+    sample_weight: np.ndarray,
+    quantile: float,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+    coef_init: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Fit a batch of independent linear quantile regressions with IRLS.
+
+    Each problem minimizes the weighted pinball loss of its own rows.
+    All problems are solved together: every iteration is one batched
+    weighted least squares solve with the weights of the check function
+    w = quantile / |r| for r >= 0 and (1 - quantile) / |r| otherwise.
+    Features are standardized per problem, constant features get a zero
+    coefficient.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Features of shape (n_problems, n_rows, n_features).
+    y : np.ndarray
+        Targets of shape (n_problems, n_rows).
+    sample_weight : np.ndarray
+        Row weights of shape (n_problems, n_rows). Zero weight marks padding rows.
+    quantile : float
+        Quantile to fit.
+    max_iter : int, optional
+        Maximum number of IRLS iterations, by default 100.
+    tol : float, optional
+        Relative tolerance on the coefficients change, by default 1e-6.
+    coef_init : np.ndarray, optional
+        Warm start coefficients of shape (n_problems, n_features + 1) in the
+        format of the result. Problems with NaN coefficients start from the
+        least squares solution.
+
+    Returns
+    -------
+    np.ndarray
+        Coefficients of shape (n_problems, n_features + 1), intercept last.
+        Problems without rows get zero coefficients.
+    """
+    n_problems, n_rows, n_features = X.shape
+
+    weight_sum = sample_weight.sum(axis=1, keepdims=True)
+    weight_sum = np.where(weight_sum > 0, weight_sum, 1)
+    mean = np.einsum("bn,bnp->bp", sample_weight, X) / weight_sum
+    centered = X - mean[:, None, :]
+    scale = np.sqrt(np.einsum("bn,bnp->bp", sample_weight, centered**2) / weight_sum)
+    scale = np.where(scale > 0, scale, np.inf)
+
+    Z = np.concatenate(
+        (centered / scale[:, None, :], np.ones((n_problems, n_rows, 1))),
+        axis=2,
+    )
+    identity = np.eye(n_features + 1)
+
+    beta = np.zeros((n_problems, n_features + 1))
+    weights = sample_weight
+    if coef_init is not None:
+        # Переводим начальные коэффициенты в пространство стандартизованных признаков
+        has_init = ~np.isnan(coef_init).any(axis=1)
+        init = np.nan_to_num(coef_init)
+        # У постоянных признаков масштаб бесконечен, их коэффициент в Z равен нулю
+        beta[:, :n_features] = init[:, :n_features] * np.where(np.isfinite(scale), scale, 0)
+        beta[:, n_features] = init[:, n_features] + (init[:, :n_features] * mean).sum(axis=1)
+        beta[~has_init] = 0
+        weights = np.where(
+            has_init[:, None],
+            _check_weights(Z, y, beta, sample_weight, quantile),
+            sample_weight,
+        )
+
+    for _ in range(max_iter):
+        ZW = (Z * weights[..., None]).transpose(0, 2, 1)
+        A = ZW @ Z
+        ridge = _RIDGE * A.diagonal(axis1=1, axis2=2).max(axis=1) + _RIDGE
+        beta_new = np.linalg.solve(A + ridge[:, None, None] * identity, ZW @ y[..., None])[..., 0]
+
+        change = np.abs(beta_new - beta).max()
+        beta = beta_new
+        if change <= tol * (1 + np.abs(beta).max()):
+            break
+
+        weights = _check_weights(Z, y, beta, sample_weight, quantile)
+
+    coef = beta[:, :n_features] / scale
+    intercept = beta[:, n_features] - (coef * mean).sum(axis=1)
+    return np.concatenate((coef, intercept[:, None]), axis=1)
+
+
+def _check_weights(
+    Z: np.ndarray,
+    y: np.ndarray,
+    beta: np.ndarray,
+    sample_weight: np.ndarray,
+    quantile: float,
+) -> np.ndarray:
+    """IRLS weights of the pinball loss at the current coefficients."""
+    residuals = y - (Z @ beta[..., None])[..., 0]
+    return (
+        sample_weight
+        * np.where(residuals >= 0, quantile, 1 - quantile)
+        / np.maximum(np.abs(residuals), _RESIDUAL_EPS)
+    )
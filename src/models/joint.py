@@ -0,0 +1,98 @@
+import warnings
+from typing import List
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+
+def fit_joint_quantile_regression(
+    X: np.ndarray,
+    Y: np.ndarray,
+    quantiles: List[float],
+    sample_weight: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Fit linear quantile regressions for all quantiles of each target in one LP.
+
+    For every target column a single HiGHS LP is solved over the coefficients
+    of all quantiles:
+
+        min  sum_k q_k * w'u_k + (1 - q_k) * w'v_k
+        s.t. X b_k + u_k - v_k = y,  u_k, v_k >= 0
+             X b_k <= X b_{k+1}       (non-crossing at the training rows)
+
+    The constraint matrices depend only on X and are built once for all
+    target columns. Quantiles may still cross on rows outside X; callers
+    that need ordered predictions sort them (see `MultiTargetModel.predict`).
+    The LP has n_quantiles times more variables than a single-quantile one,
+    so it takes longer than solving the quantiles separately.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Features of shape (n_rows, n_features).
+    Y : np.ndarray
+        Targets of shape (n_rows, n_targets).
+    quantiles : List[float]
+        Quantiles to fit, in any order.
+    sample_weight : np.ndarray, optional
+        Row weights w of shape (n_rows,), by default all ones.
+
+    Returns
+    -------
+    np.ndarray
+        Coefficients of shape (n_quantiles, n_targets, n_features + 1),
+        intercept last, in the order of `quantiles`.
+    """
+    n_rows, n_features = X.shape
+    n_quantiles = len(quantiles)
+    order = np.argsort(quantiles)
+    sorted_quantiles = np.asarray(quantiles, dtype=float)[order]
+
+    X_full = sparse.csr_matrix(np.hstack((X, np.ones((n_rows, 1)))))
+    identity = sparse.identity(n_rows, format="csr")
+    n_params = n_features + 1
+    n_block = n_params + 2 * n_rows
+
+    # Блок одного квантиля: [b_k, u_k, v_k]
+    A_eq = sparse.kron(
+        sparse.identity(n_quantiles),
+        sparse.hstack((X_full, identity, -identity)),
+        format="csr",
+    )
+    differences = sparse.diags(
+        [np.ones(n_quantiles - 1), -np.ones(n_quantiles - 1)],
+        [0, 1],
+        shape=(n_quantiles - 1, n_quantiles),
+    )
+    A_ub = sparse.kron(
+        differences,
+        sparse.hstack((X_full, sparse.csr_matrix((n_rows, 2 * n_rows)))),
+        format="csr",
+    )
+    weights = np.ones(n_rows) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    c = np.concatenate([
+        np.concatenate((np.zeros(n_params), q * weights, (1 - q) * weights))
+        for q in sorted_quantiles
+    ])
+    bounds = ([(None, None)] * n_params + [(0, None)] * (2 * n_rows)) * n_quantiles
+
+    coef = np.zeros((n_quantiles, Y.shape[1], n_params))
+    for j in range(Y.shape[1]):
+        result = linprog(
+            c,
+            A_ub=A_ub if n_quantiles > 1 else None,
+            b_ub=np.zeros(A_ub.shape[0]) if n_quantiles > 1 else None,
+            A_eq=A_eq,
+            b_eq=np.tile(Y[:, j], n_quantiles),
+            bounds=bounds,
+            method="highs",
+        )
+        if result.x is None:
+            warnings.warn(f"Joint quantile LP failed: {result.message}")
+            continue
+        solution = result.x.reshape(n_quantiles, n_block)[:, :n_params]
+        coef[order, j] = solution
+    return coef
@@ -1,4 +1,9 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
 from typing import List
+from typing import Optional
 from typing import Tuple
 
 import numpy as np
@@ -6,6 +11,14 @@ import pandas as pd
 from sklearn.linear_model import QuantileRegressor
 from tqdm import tqdm
 
+from src.models.batched import fit_quantile_regression
+from src.models.joint import fit_joint_quantile_regression
+
+# Максимальное число элементов матрицы признаков в одном блоке SKU для solver="irls"
+_BATCH_SIZE = 2**22
+# Число строк данных, для которых коэффициенты собираются за раз в predict
+_PREDICT_BATCH_ROWS = 2**13
+
 
 def split_train_test(
     df: pd.DataFrame,
@@ -33,12 +46,96 @@ def split_train_test(
     df_test = df[df['day']>= split_day]
     return df_train, df_test
 
+def _fit_sku_models(
+    sku_chunk: List[Tuple[int, np.ndarray, np.ndarray]],
+    features: List[str],
+    quantiles: List[float],
+    horizons: List[int],
+    solver: str = "highs",
+    deduplicate: bool = False,
+) -> List[Tuple[int, np.ndarray]]:
+    """
+    Fit quantile regression models for a chunk of sku_id.
+
+    Used both by serial and process-pool fitting, so the results are identical.
+
+    Parameters
+    ----------
+    sku_chunk : List[Tuple[int, np.ndarray, np.ndarray]]
+        List of (sku_id, features, targets); targets have one column per horizon.
+    features : List[str]
+        Names of the features columns.
+    quantiles : List[float]
+        List of quantiles.
+    horizons : List[int]
+        List of horizons.
+    solver : str
+        "highs" fits a QuantileRegressor per quantile and horizon,
+        "joint" fits all quantiles of a horizon in one non-crossing LP.
+    deduplicate : bool
+        Merge identical rows into one row weighted by the number of copies.
+
+    Returns
+    -------
+    List[Tuple[int, np.ndarray]]
+        List of (sku_id, coefficients) with coefficients of shape
+        (n_quantiles, n_horizons, n_features + 1), intercept last.
+    """
+    results = []
+    for sku_id, X, Y in sku_chunk:
+        if solver == "joint":
+            weights = None
+            if deduplicate:
+                X, Y, weights = _deduplicate(X, Y)
+            results.append((sku_id, fit_joint_quantile_regression(X, Y, quantiles, weights)))
+            continue
+
+        coef = np.zeros((len(quantiles), len(horizons), len(features) + 1))
+        for j, horizon in enumerate(horizons):
+            X_target, y, weights = X, Y[:, j], None
+            if deduplicate:
+                X_target, y, weights = _deduplicate(X, Y[:, [j]])
+                y = y[:, 0]
+            df_features = pd.DataFrame(X_target, columns=features)
+
+            for i, quantile in enumerate(quantiles):
+                model = QuantileRegressor(
+                    quantile=quantile,
+                    alpha=0,
+                    solver="highs",
+                )
+                model.fit(df_features, y, sample_weight=weights)
+                coef[i, j, :-1] = model.coef_
+                coef[i, j, -1] = model.intercept_
+        results.append((sku_id, coef))
+    return results
+
+
+def _deduplicate(X: np.ndarray, Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge identical (features, targets) rows.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Unique features, targets and the number of copies of each row.
+    """
+    rows, counts = np.unique(np.hstack((X, Y)), axis=0, return_counts=True)
+    return rows[:, :X.shape[1]], rows[:, X.shape[1]:], counts.astype(float)
+
+
 class MultiTargetModel:
     def __init__(
         self,
         features: List[str],
         horizons: List[int] = [7, 14, 21],
         quantiles: List[float] = [0.1, 0.5, 0.9],
+        solver: str = "highs",
+        n_jobs: int = 1,
+        chunk_size: int = 16,
+        pooled_min_rows: Optional[int] = None,
+        zero_share: Optional[float] = None,
+        deduplicate: bool = False,
+        refit_tolerance: float = 0.1,
     ) -> None:
         """
         Parameters
@@ -49,27 +146,67 @@ class MultiTargetModel:
             List of horizons.
         quantiles : List[float]
             List of quantiles.
+        solver : str
+            "highs" fits a separate sklearn QuantileRegressor (HiGHS LP) for
+            every sku_id, quantile and horizon.
+            "irls" fits all sku_id of a (quantile, horizon) pair together with
+            a batched iteratively reweighted least squares solver.
+            "joint" fits all quantiles of a (sku_id, horizon) in one HiGHS LP
+            with non-crossing constraints at the training rows; `predict`
+            sorts the quantiles of every horizon, so they never cross on
+            new rows either. The LP is larger than the separate ones, so
+            it is slower than "highs".
+        n_jobs : int
+            Number of worker processes for solver="highs" and "joint";
+            -1 uses all CPUs.
+            Each worker receives only the arrays of its sku_id.
+        chunk_size : int
+            Number of sku_id sent to a worker at once.
+        pooled_min_rows : int, optional
+            sku_id with fewer rows with a nonzero target get coefficients of a
+            pooled model fitted on all such sku_id at once (one IRLS solve per
+            quantile and horizon). Features and targets of every sku_id are
+            divided by its mean demand before pooling, so the pooled model is
+            shared in relative terms. None (default) fits every sku_id separately.
+        zero_share : float, optional
+            sku_id with at least this share of rows where all targets are zero
+            get intercept-only models equal to the empirical quantiles of the
+            targets, without solving an LP. None (default) disables it.
+        deduplicate : bool
+            Merge identical (features, target) rows into one weighted row before
+            solving the LP for solver="highs" and "joint". The optimum is the same,
+            but the LP of an intermittent-demand sku_id shrinks many times.
+        refit_tolerance : float
+            `partial_fit` keeps the coefficients of a sku_id while the rows
+            added since the last fit raise its total training pinball loss by
+            at most this share, over what the same number of rows would add
+            at its training mean loss.
 
         Attributes
         ----------
-        fitted_models_ : dict
-            Dictionary with fitted models for each sku_id.
-            Example:
-            {
-                sku_id_1: {
-                    (quantile_1, horizon_1): model_1,
-                    (quantile_1, horizon_2): model_2,
-                    ...
-                },
-                sku_id_2: {
-                    (quantile_1, horizon_1): model_3,
-                    (quantile_1, horizon_2): model_4,
-                    ...
-                },
-                ...
-            }
+        coef_ : np.ndarray
+            Coefficients of shape (n_skus, n_quantiles, n_horizons, n_features + 1),
+            intercept last.
+        sku_ids_ : np.ndarray
+            sku_id of each row of `coef_`.
+        fingerprints_ : np.ndarray
+            Hash of the training data of each row of `coef_`, used by `partial_fit`.
+        fit_days_ : np.ndarray
+            Last training day of each row of `coef_`.
+        losses_ : np.ndarray
+            Mean pinball loss and number of training rows, of shape (n_skus, 2),
+            for each row of `coef_`.
+        groups_ : np.ndarray
+            Group of each row of `coef_` at its last fit, see `_sku_groups`.
 
+        Raises
+        ------
+        ValueError
+            If solver is not one of the following: "highs", "irls", "joint"
         """
+        if solver not in ("highs", "irls", "joint"):
+            raise ValueError(f"Unknown solver: {solver}")
+
         self.quantiles = quantiles
         self.horizons = horizons
         self.sku_col = "sku_id"
@@ -77,7 +214,54 @@ class MultiTargetModel:
         self.features = features
         self.targets = [f"next_{horizon}d" for horizon in self.horizons]
 
-        self.fitted_models_ = {}
+        self.solver = solver
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.pooled_min_rows = pooled_min_rows
+        self.zero_share = zero_share
+        self.deduplicate = deduplicate
+        self.refit_tolerance = refit_tolerance
+
+        self.sku_ids_ = np.array([])
+        self.coef_ = np.zeros((0, len(quantiles), len(horizons), len(features) + 1))
+        self.fingerprints_ = np.array([], dtype=object)
+        self.fit_days_ = np.array([], dtype="datetime64[ns]")
+        self.losses_ = np.zeros((0, 2))
+        self.groups_ = np.array([], dtype=object)
+
+    def __setstate__(self, state: dict) -> None:
+        """Restore a pickled model.
+
+        Models pickled with a `fitted_models_` dict of QuantileRegressor
+        objects are converted to the coefficient array.
+        """
+        state.setdefault("solver", "highs")
+        state.setdefault("n_jobs", 1)
+        state.setdefault("chunk_size", 16)
+        state.setdefault("pooled_min_rows", None)
+        state.setdefault("zero_share", None)
+        state.setdefault("deduplicate", False)
+        state.setdefault("refit_tolerance", 0.1)
+
+        fitted_models = state.pop("fitted_models_", None)
+        if fitted_models is not None:
+            quantiles, horizons = state["quantiles"], state["horizons"]
+            coef = np.zeros(
+                (len(fitted_models), len(quantiles), len(horizons), len(state["features"]) + 1)
+            )
+            for row, models_one_sku in enumerate(fitted_models.values()):
+                for (quantile, horizon), model in models_one_sku.items():
+                    i, j = quantiles.index(quantile), horizons.index(horizon)
+                    coef[row, i, j, :-1] = model.coef_
+                    coef[row, i, j, -1] = model.intercept_
+            state["sku_ids_"] = np.array(list(fitted_models))
+            state["coef_"] = coef
+        state.setdefault("fingerprints_", np.full(len(state["sku_ids_"]), "", dtype=object))
+        # Без дня последнего обучения partial_fit переобучает все sku_id
+        state.setdefault("fit_days_", np.full(len(state["sku_ids_"]), "NaT", dtype="datetime64[ns]"))
+        state.setdefault("losses_", np.zeros((len(state["sku_ids_"]), 2)))
+        state.setdefault("groups_", np.full(len(state["sku_ids_"]), "", dtype=object))
+        self.__dict__.update(state)
 
     def fit(self, data: pd.DataFrame, verbose: bool = False) -> None:
         """Fit model on data.
@@ -92,27 +276,448 @@ class MultiTargetModel:
         """
         df = self._prepare_data(data)
 
-        for sku_id in tqdm(df.index.get_level_values(0).unique(), disable=not verbose):
-            df_sku = df.loc[pd.IndexSlice[sku_id, :], :]  # type: ignore
-            df_features = df_sku[self.features]
+        self.sku_ids_, self.coef_ = self._fit_skus(df, verbose)
+        (
+            self.fingerprints_, self.fit_days_, self.losses_, self.groups_
+        ) = self._fit_state(df, self.sku_ids_)
 
-            models_one_sku = {}
-            for horizon in self.horizons:
-                for quantile in self.quantiles:
-                    target_name = f"next_{horizon}d"
-                    y = df_sku[target_name]
+    def partial_fit(self, data: pd.DataFrame, verbose: bool = False) -> Dict[str, int]:
+        """Refit only the sku_id whose data changed materially since the last fit.
 
-                    model = QuantileRegressor(
-                        quantile=quantile,
-                        alpha=0,
-                        solver="highs",
-                    )
-                    model.fit(df_features, y)
-                    models_one_sku[(quantile, horizon)] = model
-            self.fitted_models_[sku_id] = models_one_sku
+        A sku_id keeps its coefficients if its rows up to its last training
+        day are unchanged and the pinball loss of the rows added after that
+        day, under the current coefficients, does not raise its total
+        training loss materially (see `refit_tolerance`). The added rows are
+        not recorded, so they accumulate until they matter for the fit.
+        Other sku_id are warm-started from their previous coefficients with
+        solver="irls" and refitted from scratch with the LP solvers, as are
+        new sku_id and sku_id of the pooled and constant models.
+        The pooled model is shared, so if any of its sku_id changes, or
+        a sku_id joins or leaves it, it is refitted on every pooled sku_id
+        in `data`, exactly as `fit` would. sku_id absent from `data` keep
+        their coefficients. A model that was never fitted is fitted on
+        `data` with `fit`.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            Data to fit on.
+        verbose : bool, optional
+            Whether to show progress bar, by default False
+
+        Returns
+        -------
+        Dict[str, int]
+            Number of "skipped", "warm_started" and "refitted" sku_id.
+            Also stored in `partial_fit_stats_`.
+        """
+        if len(self.sku_ids_) == 0:
+            # Модель еще не обучалась: обучаем все sku_id с нуля
+            self.fit(data, verbose)
+            self.partial_fit_stats_ = {
+                "skipped": 0,
+                "warm_started": 0,
+                "refitted": len(self.sku_ids_),
+            }
+            return self.partial_fit_stats_
+
+        df = self._prepare_data(data)
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        sku_ids = np.asarray(sku_ids)
+
+        coef_rows = pd.Index(self.sku_ids_).get_indexer(sku_ids)
+        known = coef_rows >= 0
+
+        # Строки, которые уже были в данных при последнем обучении sku_id
+        fit_days = np.where(known, self.fit_days_[coef_rows], np.datetime64("NaT"))
+        seen = df.index.get_level_values(1).to_numpy() <= fit_days[codes]
+        history = np.full(len(sku_ids), "", dtype=object)
+        seen_ids, seen_fingerprints = self._fingerprints(df[seen])
+        history[pd.Index(sku_ids).get_indexer(seen_ids)] = seen_fingerprints
+        same_history = known & (history == self.fingerprints_[coef_rows])
+
+        # Потери на новых строках при текущих коэффициентах
+        new_losses = np.zeros((len(sku_ids), 2))
+        new_ids, losses = self._pinball_losses(df[~seen])
+        new_losses[pd.Index(sku_ids).get_indexer(new_ids)] = losses
+        new_mean, n_new = new_losses.T
+        train_mean, n_train = self.losses_[coef_rows].T
+        # Прирост целевой функции обучения сверх ожидаемого при прежнем среднем
+        excess = (new_mean - train_mean) * n_new
+        drifted = excess > self.refit_tolerance * train_mean * n_train
+
+        unchanged = same_history & ~drifted
+        groups = self._sku_groups(df)[1]
+        pooled = groups == "pooled"
+        was_pooled = known & (self.groups_[coef_rows] == "pooled")
+        # Пул обучается одной моделью: при изменении любого его sku_id
+        # или состава пула переобучаем его целиком
+        if ((pooled | was_pooled) & (~unchanged | (pooled != was_pooled))).any():
+            unchanged[pooled | was_pooled] = False
+        warm_started = known & ~unchanged & (groups == "separate")
+        if self.solver != "irls":
+            warm_started[:] = False
 
+        df_changed = df[~unchanged[codes]]
+        coef_init = None
+        if warm_started.any():
+            coef_init = np.full((len(sku_ids),) + self.coef_.shape[1:], np.nan)
+            coef_init[warm_started] = self.coef_[coef_rows[warm_started]]
+            coef_init = coef_init[~unchanged]
+        changed_ids, changed_coef = self._fit_skus(df_changed, verbose, coef_init)
 
+        # Заменяем коэффициенты изменившихся sku_id и добавляем новые
+        keep = ~pd.Index(self.sku_ids_).isin(changed_ids)
+        self.sku_ids_ = np.concatenate((self.sku_ids_[keep], changed_ids))
+        self.coef_ = np.concatenate((self.coef_[keep], changed_coef))
+        changed_state = self._fit_state(df_changed, changed_ids)
+        self.fingerprints_, self.fit_days_, self.losses_, self.groups_ = (
+            np.concatenate((state[keep], changed))
+            for state, changed in zip(
+                (self.fingerprints_, self.fit_days_, self.losses_, self.groups_),
+                changed_state,
+            )
+        )
 
+        order = np.argsort(self.sku_ids_, kind="stable")
+        for attr in ("sku_ids_", "coef_", "fingerprints_", "fit_days_", "losses_", "groups_"):
+            setattr(self, attr, getattr(self, attr)[order])
+
+        self.partial_fit_stats_ = {
+            "skipped": int(unchanged.sum()),
+            "warm_started": int(warm_started.sum()),
+            "refitted": int((~unchanged & ~warm_started).sum()),
+        }
+        return self.partial_fit_stats_
+
+    def _fit_state(
+        self,
+        df: pd.DataFrame,
+        sku_ids: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Record what `partial_fit` compares new data against.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data` that the sku_id were just fitted on.
+        sku_ids : np.ndarray
+            sku_id to return the state for, all present in data.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+            Fingerprint of the rows, last day, mean pinball loss with
+            the number of rows, and group of each sku_id.
+        """
+        fingerprint_ids, fingerprints = self._fingerprints(df)
+        rows = pd.Index(fingerprint_ids).get_indexer(sku_ids)
+
+        days = df.index.get_level_values(1).to_numpy()
+        # Данные отсортированы по (sku_id, day), последний день sku_id - в его последней строке
+        codes = pd.factorize(df.index.get_level_values(0))[0]
+        last_rows = np.cumsum(np.bincount(codes)) - 1
+        last_days = days[last_rows].astype("datetime64[ns]")
+
+        loss_ids, losses = self._pinball_losses(df)
+        loss_rows = pd.Index(loss_ids).get_indexer(sku_ids)
+
+        group_ids, groups = self._sku_groups(df)
+        group_rows = pd.Index(group_ids).get_indexer(sku_ids)
+        return fingerprints[rows], last_days[rows], losses[loss_rows], groups[group_rows]
+
+    def _pinball_losses(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Pinball loss of every sku_id in data under the current coefficients.
+
+        The loss of a row is averaged over quantiles and horizons.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and the mean loss with the number of rows, of shape (n_skus, 2).
+        """
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        y_pred = self._predict_values(
+            df[self.features].to_numpy(dtype=float), df.index.get_level_values(0)
+        )
+        # Ошибка имеет форму (n_rows, n_horizons, n_quantiles)
+        errors = df[self.targets].to_numpy(dtype=float)[:, :, None] - y_pred
+        quantiles = np.asarray(self.quantiles)
+        row_losses = np.maximum(quantiles * errors, (quantiles - 1) * errors).mean(axis=(1, 2))
+
+        sizes = np.bincount(codes, minlength=len(sku_ids))
+        mean = np.bincount(codes, weights=row_losses, minlength=len(sku_ids)) / np.maximum(sizes, 1)
+        return np.asarray(sku_ids), np.column_stack((mean, sizes))
+
+    def _fingerprints(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Hash features and targets of every sku_id.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and the fingerprint of its rows.
+        """
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        starts = np.concatenate(([0], np.cumsum(np.bincount(codes))))
+        values = np.ascontiguousarray(df[self.features + self.targets].to_numpy(dtype=float))
+
+        fingerprints = np.array([
+            hashlib.blake2b(values[start:stop].tobytes(), digest_size=16).hexdigest()
+            for start, stop in zip(starts[:-1], starts[1:])
+        ], dtype=object)
+        return np.asarray(sku_ids), fingerprints
+
+    def _fit_skus(
+        self,
+        df: pd.DataFrame,
+        verbose: bool = False,
+        coef_init: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit coefficients of every sku_id in data with the model of its group.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+        verbose : bool, optional
+            Whether to show progress bar, by default False
+        coef_init : np.ndarray, optional
+            Initial coefficients for solver="irls", one row per sku_id in data.
+            Rows with NaN are fitted from scratch.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and their coefficients.
+        """
+        if self.pooled_min_rows is None and self.zero_share is None:
+            return self._fit_separately(df, verbose, coef_init)
+
+        sku_index = df.index.get_level_values(0)
+        sku_ids, groups = self._sku_groups(df)
+        separate = groups == "separate"
+
+        fitted = [
+            self._fit_separately(
+                df[sku_index.isin(sku_ids[separate])],
+                verbose,
+                None if coef_init is None else coef_init[separate],
+            ),
+            self._fit_pooled(df[sku_index.isin(sku_ids[groups == "pooled"])]),
+            self._fit_constant(df[sku_index.isin(sku_ids[groups == "constant"])]),
+        ]
+        fitted_ids = np.concatenate([ids for ids, _ in fitted])
+        order = np.argsort(pd.Index(sku_ids).get_indexer(fitted_ids))
+        return fitted_ids[order], np.concatenate([coef for _, coef in fitted])[order]
+
+    def _sku_groups(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Choose how every sku_id is fitted.
+
+        sku_id with at least `zero_share` rows where all targets are zero get
+        the "constant" model; sku_id with fewer than `pooled_min_rows` rows with
+        a nonzero target get the "pooled" model; the rest are fitted "separate".
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and its group: "separate", "pooled" or "constant".
+        """
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        groups = np.full(len(sku_ids), "separate", dtype=object)
+
+        informative = (df[self.targets].to_numpy() != 0).any(axis=1)
+        counts = np.bincount(codes, weights=informative, minlength=len(sku_ids))
+        if self.pooled_min_rows is not None:
+            groups[counts < self.pooled_min_rows] = "pooled"
+        if self.zero_share is not None:
+            sizes = np.bincount(codes, minlength=len(sku_ids))
+            groups[(sizes - counts) >= self.zero_share * sizes] = "constant"
+        return np.asarray(sku_ids), groups
+
+    def _fit_constant(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit intercept-only models for every sku_id in data.
+
+        The intercept is the empirical quantile of the target, which minimizes
+        the pinball loss of a constant prediction; no LP is solved.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and their coefficients.
+        """
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        starts = np.concatenate(([0], np.cumsum(np.bincount(codes))))
+        Y = df[self.targets].to_numpy(dtype=float)
+
+        coef = np.zeros((len(sku_ids),) + self.coef_.shape[1:])
+        for row, (start, stop) in enumerate(zip(starts[:-1], starts[1:])):
+            coef[row, :, :, -1] = np.quantile(
+                Y[start:stop], self.quantiles, axis=0, method="inverted_cdf"
+            )
+        return np.asarray(sku_ids), coef
+
+    def _fit_pooled(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit one model per quantile and horizon on all sku_id in data.
+
+        Rows of every sku_id are divided by its mean demand over the longest
+        horizon, so that y / s = b0 + b x / s. The per-sku_id coefficients
+        are then (b, s * b0).
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and their coefficients.
+        """
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        coef = np.zeros((len(sku_ids),) + self.coef_.shape[1:])
+        if len(sku_ids) == 0:
+            return np.asarray(sku_ids), coef
+
+        X = df[self.features].to_numpy(dtype=float)
+        Y = df[self.targets].to_numpy(dtype=float)
+
+        longest = int(np.argmax(self.horizons))
+        scale = np.bincount(codes, weights=np.abs(Y[:, longest])) / np.bincount(codes)
+        scale = np.where(scale > 0, scale, 1)
+        X = X / scale[codes, None]
+        Y = Y / scale[codes, None]
+
+        weights = np.ones((1, len(X)))
+        for i, quantile in enumerate(self.quantiles):
+            for j in range(len(self.horizons)):
+                pooled = fit_quantile_regression(X[None], Y[None, :, j], weights, quantile)[0]
+                coef[:, i, j, :-1] = pooled[:-1]
+                coef[:, i, j, -1] = pooled[-1] * scale
+        return np.asarray(sku_ids), coef
+
+    def _fit_separately(
+        self,
+        df: pd.DataFrame,
+        verbose: bool = False,
+        coef_init: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit a separate model for every sku_id in data with the configured solver.
+
+        Parameters are the same as in `_fit_skus`.
+        """
+        if self.solver == "irls":
+            return self._fit_batched(df, verbose, coef_init)
+
+        sku_data = [
+            (
+                sku_id,
+                df_sku[self.features].to_numpy(dtype=float),
+                df_sku[self.targets].to_numpy(dtype=float),
+            )
+            for sku_id, df_sku in df.groupby(level=0, sort=False)
+        ]
+        chunks = [
+            sku_data[start:start + self.chunk_size]
+            for start in range(0, len(sku_data), self.chunk_size)
+        ]
+        args = (self.features, self.quantiles, self.horizons, self.solver, self.deduplicate)
+
+        results = []
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_fit_sku_models, chunk, *args) for chunk in chunks]
+                for future in tqdm(futures, disable=not verbose):
+                    results.extend(future.result())
+        else:
+            for chunk in tqdm(chunks, disable=not verbose):
+                results.extend(_fit_sku_models(chunk, *args))
+
+        sku_ids = np.array([sku_id for sku_id, _ in results])
+        coef = np.array([coef for _, coef in results]).reshape(
+            (len(results),) + self.coef_.shape[1:]
+        )
+        return sku_ids, coef
+
+    def _fit_batched(
+        self,
+        df: pd.DataFrame,
+        verbose: bool = False,
+        coef_init: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit all sku_id together with the batched IRLS solver.
+
+        SKU are processed in blocks; rows of a block are laid out as
+        (n_skus, max_rows, n_features) arrays with zero-weight padding.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Data prepared by `_prepare_data`.
+        verbose : bool, optional
+            Whether to show progress bar, by default False
+        coef_init : np.ndarray, optional
+            Initial coefficients, one row per sku_id in data.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            sku_id and their coefficients.
+        """
+        codes, sku_ids = pd.factorize(df.index.get_level_values(0))
+        sizes = np.bincount(codes)
+        starts = np.concatenate(([0], np.cumsum(sizes)))
+        positions = np.arange(len(codes)) - starts[codes]
+
+        X = df[self.features].to_numpy(dtype=float)
+        Y = df[self.targets].to_numpy(dtype=float)
+
+        coef = np.zeros((len(sku_ids),) + self.coef_.shape[1:])
+
+        block = max(1, _BATCH_SIZE // (sizes.max(initial=1) * (len(self.features) + 1)))
+        for start in tqdm(range(0, len(sku_ids), block), disable=not verbose):
+            stop = min(start + block, len(sku_ids))
+            rows = slice(starts[start], starts[stop])
+            index = (codes[rows] - start, positions[rows])
+            shape = (stop - start, sizes[start:stop].max())
+
+            X_block = np.zeros(shape + (len(self.features),))
+            X_block[index] = X[rows]
+            Y_block = np.zeros(shape + (len(self.targets),))
+            Y_block[index] = Y[rows]
+            weights = np.zeros(shape)
+            weights[index] = 1
+
+            for i, quantile in enumerate(self.quantiles):
+                for j in range(len(self.horizons)):
+                    coef[start:stop, i, j] = fit_quantile_regression(
+                        X_block,
+                        Y_block[..., j],
+                        weights,
+                        quantile,
+                        coef_init=None if coef_init is None else coef_init[start:stop, i, j],
+                    )
+        return np.asarray(sku_ids), coef
 
     def predict(self, data: pd.DataFrame) -> pd.DataFrame:
         """Predict on data.
@@ -129,62 +734,108 @@ class MultiTargetModel:
         pd.DataFrame
             Predictions with columns grouped by quantiles and horizons.
         """
-        # Создаем копию данных и устанавливаем индексы
-        X = data.copy().set_index([self.sku_col, self.date_col])
-        X = X.sort_index()
-        results = []
-        for sku in X.index.get_level_values(self.sku_col).unique():
-            fitted_models_sku = self.fitted_models_.get(sku, None)           
-            if fitted_models_sku:
-                test_data_sku = X.loc[sku, self.features]
-                temp_dict = {
-                    'sku_id': sku,
-                    'day': test_data_sku.index
-                }
-
-                for horizon in self.horizons:
-                    for quantile in self.quantiles:
-                        model = fitted_models_sku.get((horizon, quantile), None)
-                        if model:
-                            y_pred = model.predict(test_data_sku)
-                        else:
-                            y_pred = [0] * len(test_data_sku)
-                        # Изменяем формат названия столбца
-                        q_str = str(int(quantile * 100)).zfill(2)
-                        temp_dict[f'pred_{horizon}d_q{q_str}'] = y_pred
-
-            else:
-                temp_dict = {
-                    'sku_id': sku,
-                    'day': X.loc[sku].index
-                }
-                for horizon in self.horizons:
-                    for quantile in self.quantiles:
-                        q_str = str(int(quantile * 100)).zfill(2)
-                        temp_dict[f'pred_{horizon}d_q{q_str}'] = [0] * len(temp_dict['day'])
-            results.append(pd.DataFrame(temp_dict))
-        return pd.concat(results).reset_index(drop=True)
-
-    def _prepare_data(self, data: pd.DataFrame) -> pd.DataFrame:
+        X = self._prepare_data(data, self.features, dropna=False)
+        y_pred = self._predict_values(
+            X[self.features].to_numpy(dtype=float), X.index.get_level_values(self.sku_col)
+        )
+        n_targets = len(self.quantiles) * len(self.horizons)
+
+        columns = [
+            f'pred_{horizon}d_q{str(int(quantile * 100)).zfill(2)}'
+            for horizon in self.horizons
+            for quantile in self.quantiles
+        ]
+        predictions = pd.DataFrame(y_pred.reshape(len(X), n_targets), columns=columns)
+        predictions.insert(0, 'sku_id', X.index.get_level_values(self.sku_col))
+        predictions.insert(1, 'day', X.index.get_level_values(self.date_col))
+        return predictions
+
+    def _predict_values(self, features: np.ndarray, sku_index: pd.Index) -> np.ndarray:
+        """Predictions of shape (n_rows, n_horizons, n_quantiles), 0 for new sku_id.
+
+        With solver="joint" the quantiles of every horizon are sorted.
+
+        Parameters
+        ----------
+        features : np.ndarray
+            Features of shape (n_rows, n_features).
+        sku_index : pd.Index
+            sku_id of each row.
+
+        Returns
+        -------
+        np.ndarray
+            Predictions of every row.
+        """
+        # Строка коэффициентов для каждой строки данных, -1 для новых sku_id
+        coef_rows = pd.Index(self.sku_ids_).get_indexer(sku_index)
+        known = coef_rows >= 0
+
+        y_pred = np.zeros((len(features), len(self.horizons), len(self.quantiles)))
+        for start in range(0, len(features), _PREDICT_BATCH_ROWS):
+            batch = slice(start, start + _PREDICT_BATCH_ROWS)
+            # Блок только из новых sku_id остается нулевым, в том числе у необученной модели
+            if not known[batch].any():
+                continue
+            coef = self.coef_[np.where(known[batch], coef_rows[batch], 0)]
+            batch_pred = (
+                np.einsum("np,nqhp->nhq", features[batch], coef[..., :-1])
+                + coef[..., -1].transpose(0, 2, 1)
+            )
+            y_pred[batch] = np.where(known[batch, None, None], batch_pred, 0)
+
+        if self.solver == "joint":
+            # Ограничения LP держат порядок квантилей только на обучающих строках,
+            # вне их упорядочиваем прогнозы каждого горизонта перестановкой
+            y_pred[..., np.argsort(self.quantiles)] = np.sort(y_pred, axis=2)
+        return y_pred
+
+    def _prepare_data(
+        self,
+        data: pd.DataFrame,
+        columns: Optional[List[str]] = None,
+        dropna: bool = True,
+    ) -> pd.DataFrame:
         """Prepare data for fitting and predicting.
 
+        Only the needed columns are taken from `data`, the input frame is
+        never copied as a whole. Rows are sorted by (sku_id, day) only if
+        they are not sorted already.
+
         Parameters
         ----------
         data : pd.DataFrame
             Data to prepare.
+        columns : List[str], optional
+            Columns to keep, by default features and targets.
+        dropna : bool, optional
+            Drop rows with missing values, by default True.
 
         Returns
         -------
         pd.DataFrame
-            Prepared data.
+            Prepared data indexed by (sku_id, day).
         """
-        df = data.copy()
-        df.dropna(inplace=True)
-        df[self.date_col] = pd.to_datetime(df[self.date_col])
+        if columns is None:
+            columns = self.features + self.targets
+
+        days = data[self.date_col]
+        if not pd.api.types.is_datetime64_any_dtype(days):
+            days = pd.to_datetime(days)
+        index = pd.MultiIndex.from_arrays([data[self.sku_col], days])
+        df = data[columns].set_axis(index)
 
-        df.set_index([self.sku_col, self.date_col], inplace=True)
-        df.sort_index(inplace=True)
+        if dropna:
+            valid = (
+                df.notna().all(axis=1).to_numpy()
+                & data[self.sku_col].notna().to_numpy()
+                & days.notna().to_numpy()
+            )
+            if not valid.all():
+                df = df[valid]
 
-        df = df[self.features + self.targets]
+        # Проверка упорядоченности дешевле сортировки на уже упорядоченных данных
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
 
-        return df
\ No newline at end of file
+        return df
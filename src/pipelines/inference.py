@@ -12,27 +12,20 @@ from clearml.automation.controller import PipelineDecorator
     return_values=["orders"],
     task_type=TaskTypes.data_processing,
 )
-def fetch_orders(orders_url: str) -> pd.DataFrame:
-    import requests
-    from urllib.parse import urlencode
-    import pandas as pd
-    from clearml import StorageManager
+def fetch_orders(
+    orders_url: str,
+    chunksize: Optional[int] = None,
+    cache: Optional[Dict] = None,
+) -> pd.DataFrame:
+    from src.data.ingestion import load_orders
+    from src.data.schema import report_memory
 
     print(f"Downloading orders data from {orders_url}...")
 
-    base_url = "https://cloud-api.yandex.net/v1/disk/public/resources/download?"
-    full_url = base_url + urlencode(dict(public_key=orders_url))
-    response = requests.get(full_url)
-    download_url = response.json()["href"]
-
-    local_path = StorageManager.get_local_copy(remote_url=download_url)
-    df_orders = pd.read_csv(
-        local_path,
-        parse_dates=["timestamp"],
-        dayfirst=True,
-    )
+    df_orders = load_orders(orders_url, chunksize=chunksize, cache=cache)
 
     print(f"Orders data downloaded. orders.csv shape: {df_orders.shape}")
+    report_memory(df_orders, "fetch_orders")
 
     return df_orders
 
@@ -41,53 +34,20 @@ def fetch_orders(orders_url: str) -> pd.DataFrame:
     return_values=["sales"],
     task_type=TaskTypes.data_processing,
 )
-def extract_sales(df_orders: pd.DataFrame) -> pd.DataFrame:
-    import pandas as pd
-    import numpy as np
+def extract_sales(
+    df_orders: pd.DataFrame,
+    cache: Optional[Dict] = None,
+    sales_path: Optional[str] = None,
+) -> pd.DataFrame:
+    from src.data.sales import load_sales
+    from src.data.schema import report_memory
 
     print("Extracting sales data...")
 
-    df_orders["timestamp"] = pd.to_datetime(df_orders["timestamp"], dayfirst=True)
-    df_sales = df_orders.copy()
-
-    df_sales["day"] = df_sales["timestamp"].dt.floor("D")
-
-    df_sales = (
-        df_sales.groupby(["day", "sku_id", "sku", "price"])["qty"].sum().reset_index()
-    )
-
-    all_sku_ids = df_sales["sku_id"].unique()
-    all_dates = pd.date_range(
-        df_sales["day"].min(),
-        df_sales["day"].max(),
-        freq="D",
-    )
-
-    all_dates_sku_df = pd.DataFrame(
-        {
-            "day": np.repeat(all_dates, len(all_sku_ids)),
-            "sku_id": np.tile(all_sku_ids, len(all_dates)),
-        }
-    )
-
-    df_sales = pd.merge(all_dates_sku_df, df_sales, how="left", on=["day", "sku_id"])
-    df_sales["qty"] = df_sales["qty"].fillna(0).astype(int)
-
-    # fill missing sku and price from df
-    df = df_orders[["sku_id", "sku", "price"]].drop_duplicates().reset_index(drop=True)
-    df_sales = pd.merge(
-        df_sales, df[["sku_id", "sku", "price"]], how="left", on="sku_id"
-    )
-    df_sales["sku"] = df_sales["sku_x"].fillna(df_sales["sku_y"])
-    df_sales["price"] = df_sales["price_x"].fillna(df_sales["price_y"])
-    df_sales.drop(columns=["sku_x", "sku_y", "price_x", "price_y"], inplace=True)
-
-    df_sales = df_sales[["day", "sku_id", "sku", "price", "qty"]]
-
-    df_sales.sort_values(by=["sku_id", "day"], inplace=True)
-    df_sales.reset_index(drop=True, inplace=True)
+    df_sales = load_sales(df_orders, cache=cache, sales_path=sales_path)
 
     print(f"Sales data extracted. sales.csv shape: {df_sales.shape}")
+    report_memory(df_sales, "extract_sales")
 
     return df_sales
 
@@ -99,15 +59,39 @@ def extract_sales(df_orders: pd.DataFrame) -> pd.DataFrame:
 def extract_features(
     df_sales: pd.DataFrame,
     features: Dict[str, Tuple[str, int, str, Optional[int]]],
+    feature_store_path: Optional[str] = None,
 ) -> pd.DataFrame:
+    import os
     import pandas as pd
-    from src.features.engineering import add_features
+    from src.features.engineering import last_features
+    from src.features.feature_store import FeatureStore
 
     print("Extracting features...")
 
-    df_features = df_sales.copy()
-
-    add_features(df_features, features)
+    if feature_store_path:
+        df_sales["day"] = pd.to_datetime(df_sales["day"], dayfirst=True)
+        min_day, max_day = df_sales["day"].min(), df_sales["day"].max()
+
+        store = None
+        if os.path.exists(feature_store_path):
+            store = FeatureStore.load(feature_store_path)
+        if store is None or store.features != features or not min_day <= store.day_ <= max_day:
+            print("Rebuilding feature store...")
+            store = FeatureStore(features).rebuild(df_sales)
+        else:
+            # Последний день хранилища мог быть загружен не полностью, загружаем его заново
+            new_days = df_sales[df_sales["day"] >= store.day_]
+            print(f"Appending {new_days['day'].nunique() - 1} days to feature store...")
+            for _, df_day in new_days.groupby("day"):
+                store.append_day(df_day)
+        store.save(feature_store_path)
+
+        df_features = store.to_frame()
+        print(f"Features extracted. features.csv shape: {df_features.shape}")
+        return df_features
+
+    # Для инференса нужны признаки только последнего дня каждого sku_id
+    df_features = last_features(df_sales, features)
 
     df_features["day"] = pd.to_datetime(df_features["day"], dayfirst=True)
     df_features = df_features[df_features["day"] == df_features["day"].max()]
@@ -150,12 +134,16 @@ def run_pipeline(
     orders_url: str,
     model_path: str,
     features: Dict[str, Tuple[str, int, str, Optional[int]]],
+    feature_store_path: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    cache: Optional[Dict] = None,
+    sales_path: Optional[str] = None,
 ) -> None:
-    orders_df = fetch_orders(orders_url)
+    orders_df = fetch_orders(orders_url, chunksize, cache)
 
-    df_sales = extract_sales(orders_df)
+    df_sales = extract_sales(orders_df, cache, sales_path)
 
-    df_features = extract_features(df_sales, features)
+    df_features = extract_features(df_sales, features, feature_store_path)
 
     predictions = predict(model_path, df_features)
 
@@ -165,6 +153,9 @@ def run_pipeline(
 def main(
     orders_url: str = "https://disk.yandex.ru/d/OK5gyMuEfhJA0g",
     model_path: str = "model.pkl",
+    feature_store_path: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    sales_path: Optional[str] = None,
     debug: bool = False,
 ) -> None:
     """Main function
@@ -172,6 +163,15 @@ def main(
     Args:
         orders_url (str): URL to the orders data on Yandex Disk
         model_path (str): Local path of production model
+        feature_store_path (str, optional): Local path of the feature store.
+            When set, only days after the stored state are ingested.
+            Defaults to None (features are computed over the whole history).
+        chunksize (int, optional): Read the orders CSV in chunks of this
+            many rows, aggregating them into daily sales on the fly.
+            Defaults to None (the whole file is read at once).
+        sales_path (str, optional): Local path of the sales grid kept between
+            runs. When it exists, only days after its end are appended.
+            Defaults to None (the grid is rebuilt from all orders).
         debug (bool, optional): Run the pipeline in debug mode.
             In debug mode no Taska are created, so it is running faster.
             Defaults to False.
@@ -190,6 +190,10 @@ def main(
         orders_url=orders_url,
         model_path=model_path,
         features=config['features'],
+        feature_store_path=feature_store_path,
+        chunksize=chunksize,
+        cache=config['cache'],
+        sales_path=sales_path,
     )
 
 if __name__ == "__main__":
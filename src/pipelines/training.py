@@ -14,27 +14,20 @@ from src.models.quantile_model import MultiTargetModel
     return_values=["orders"],
     task_type=TaskTypes.data_processing,
 )
-def fetch_orders(orders_url: str) -> pd.DataFrame:
-    import requests
-    from urllib.parse import urlencode
-    import pandas as pd
-    from clearml import StorageManager
+def fetch_orders(
+    orders_url: str,
+    chunksize: Optional[int] = None,
+    cache: Optional[Dict] = None,
+) -> pd.DataFrame:
+    from src.data.ingestion import load_orders
+    from src.data.schema import report_memory
 
     print(f"Downloading orders data from {orders_url}...")
 
-    base_url = "https://cloud-api.yandex.net/v1/disk/public/resources/download?"
-    full_url = base_url + urlencode(dict(public_key=orders_url))
-    response = requests.get(full_url)
-    download_url = response.json()["href"]
-
-    local_path = StorageManager.get_local_copy(remote_url=download_url)
-    df_orders = pd.read_csv(
-        local_path,
-        parse_dates=["timestamp"],
-        dayfirst=True,
-    )
+    df_orders = load_orders(orders_url, chunksize=chunksize, cache=cache)
 
     print(f"Orders data downloaded. orders.csv shape: {df_orders.shape}")
+    report_memory(df_orders, "fetch_orders")
 
     return df_orders
 
@@ -43,53 +36,20 @@ def fetch_orders(orders_url: str) -> pd.DataFrame:
     return_values=["sales"],
     task_type=TaskTypes.data_processing,
 )
-def extract_sales(df_orders: pd.DataFrame) -> pd.DataFrame:
-    import pandas as pd
-    import numpy as np
+def extract_sales(
+    df_orders: pd.DataFrame,
+    cache: Optional[Dict] = None,
+    sales_path: Optional[str] = None,
+) -> pd.DataFrame:
+    from src.data.sales import load_sales
+    from src.data.schema import report_memory
 
     print("Extracting sales data...")
 
-    df_orders["timestamp"] = pd.to_datetime(df_orders["timestamp"], dayfirst=True)
-    df_sales = df_orders.copy()
-
-    df_sales["day"] = df_sales["timestamp"].dt.floor("D")
-
-    df_sales = (
-        df_sales.groupby(["day", "sku_id", "sku", "price"])["qty"].sum().reset_index()
-    )
-
-    all_sku_ids = df_sales["sku_id"].unique()
-    all_dates = pd.date_range(
-        df_sales["day"].min(),
-        df_sales["day"].max(),
-        freq="D",
-    )
-
-    all_dates_sku_df = pd.DataFrame(
-        {
-            "day": np.repeat(all_dates, len(all_sku_ids)),
-            "sku_id": np.tile(all_sku_ids, len(all_dates)),
-        }
-    )
-
-    df_sales = pd.merge(all_dates_sku_df, df_sales, how="left", on=["day", "sku_id"])
-    df_sales["qty"] = df_sales["qty"].fillna(0).astype(int)
-
-    # fill missing sku and price from df
-    df = df_orders[["sku_id", "sku", "price"]].drop_duplicates().reset_index(drop=True)
-    df_sales = pd.merge(
-        df_sales, df[["sku_id", "sku", "price"]], how="left", on="sku_id"
-    )
-    df_sales["sku"] = df_sales["sku_x"].fillna(df_sales["sku_y"])
-    df_sales["price"] = df_sales["price_x"].fillna(df_sales["price_y"])
-    df_sales.drop(columns=["sku_x", "sku_y", "price_x", "price_y"], inplace=True)
-
-    df_sales = df_sales[["day", "sku_id", "sku", "price", "qty"]]
-
-    df_sales.sort_values(by=["sku_id", "day"], inplace=True)
-    df_sales.reset_index(drop=True, inplace=True)
+    df_sales = load_sales(df_orders, cache=cache, sales_path=sales_path)
 
     print(f"Sales data extracted. sales.csv shape: {df_sales.shape}")
+    report_memory(df_sales, "extract_sales")
 
     return df_sales
 
@@ -103,18 +63,20 @@ def extract_features(
     features: Dict[str, Tuple[str, int, str, Optional[int]]],
     targets: Dict[str, Tuple[str, int]],
 ) -> pd.DataFrame:
+    from src.data.schema import FEATURE_DTYPE, report_memory
     from src.features.engineering import add_features, add_targets
 
     print("Extracting features...")
 
     df_features = df_sales.copy()
-    add_features(df_features, features)
-    add_targets(df_features, targets)
+    add_features(df_features, features, dtype=FEATURE_DTYPE)
+    add_targets(df_features, targets, dtype=FEATURE_DTYPE)
     df_features.dropna(inplace=True)
 
     df_features.sort_values(["sku_id", "day"], inplace=True)
 
     print(f"Features extracted. features.csv shape: {df_features.shape}")
+    report_memory(df_features, "extract_features")
 
     return df_features
 
@@ -129,6 +91,7 @@ def split_train_test(
     test_days: int,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     import pandas as pd  # noqa
+    from src.data.schema import report_memory
     from src.models.quantile_model import split_train_test
 
     print("Splitting train and test data...")
@@ -136,6 +99,8 @@ def split_train_test(
     df_train, df_test = split_train_test(df_features, test_days)
 
     print("Train and test data splitted.")
+    report_memory(df_train, "split_train_test (train)")
+    report_memory(df_test, "split_train_test (test)")
 
     return df_train, df_test
 
@@ -150,7 +115,11 @@ def fit_model(
     features: List[str],
     quantiles: List[float],
     horizons: List[int],
+    fit_params: Dict,
+    warm_start_path: Optional[str] = None,
 ) -> MultiTargetModel:
+    import os
+    import pickle
     from src.models.quantile_model import MultiTargetModel
 
     print("Training production model...")
@@ -159,8 +128,33 @@ def fit_model(
         features=features,
         horizons=horizons,
         quantiles=quantiles,
+        **fit_params,
     )
-    model.fit(df_features, verbose=True)
+
+    previous = None
+    if warm_start_path and os.path.exists(warm_start_path):
+        with open(warm_start_path, "rb") as f:
+            previous = pickle.load(f)
+    # Параметры, от которых зависят коэффициенты; при их изменении обучаем заново
+    fit_attrs = (
+        "features", "horizons", "quantiles",
+        "solver", "pooled_min_rows", "zero_share", "deduplicate",
+    )
+    changed = [] if previous is None else [
+        attr for attr in fit_attrs if getattr(previous, attr) != getattr(model, attr)
+    ]
+    if previous is not None and not changed:
+        # Остальные параметры берем из текущего конфига
+        previous.n_jobs = model.n_jobs
+        previous.chunk_size = model.chunk_size
+        previous.refit_tolerance = model.refit_tolerance
+        model = previous
+        stats = model.partial_fit(df_features, verbose=True)
+        print(f"Production model updated: {stats}")
+    else:
+        if changed:
+            print(f"Model parameters changed ({', '.join(changed)}), fitting from scratch")
+        model.fit(df_features, verbose=True)
 
     print("Production model trained.")
 
@@ -177,6 +171,7 @@ def fit_eval_model(
     features: List[str],
     quantiles: List[float],
     horizons: List[int],
+    fit_params: Dict,
 ) -> MultiTargetModel:
     from src.models.quantile_model import MultiTargetModel
 
@@ -186,6 +181,7 @@ def fit_eval_model(
         features=features,
         horizons=horizons,
         quantiles=quantiles,
+        **fit_params,
     )
     model.fit(df_train, verbose=True)
 
@@ -256,10 +252,15 @@ def run_pipeline(
     targets: Dict[str, Tuple[str, int]],
     quantiles: List[float],
     horizons: List[int],
+    fit_params: Dict,
+    warm_start: bool = False,
+    chunksize: Optional[int] = None,
+    cache: Optional[Dict] = None,
+    sales_path: Optional[str] = None,
 ) -> None:
-    orders_df = fetch_orders(orders_url)
+    orders_df = fetch_orders(orders_url, chunksize, cache)
 
-    df_sales = extract_sales(orders_df)
+    df_sales = extract_sales(orders_df, cache, sales_path)
 
     df_features = extract_features(df_sales=df_sales,
                                    features=features,
@@ -268,13 +269,14 @@ def run_pipeline(
 
     model_features = ["price", "qty"] + list(features.keys())
 
-    model = fit_model(df_features, model_features, quantiles, horizons)
+    model = fit_model(df_features, model_features, quantiles, horizons, fit_params,
+                      warm_start_path=model_path if warm_start else None)
 
     df_train, df_test = split_train_test(df_features, 
                                          test_days=test_days
                                          )
     
-    eval_model = fit_eval_model(df_train,model_features, quantiles, horizons)
+    eval_model = fit_eval_model(df_train,model_features, quantiles, horizons, fit_params)
 
     losses, df_pred = evaluate(eval_model, df_test, quantiles, horizons)
 
@@ -286,6 +288,9 @@ def main(
     orders_url: str = "https://disk.yandex.ru/d/NUDMAdBMe9sbLw",
     model_path: str = "model.pkl",
     test_days: int = 30,
+    warm_start: bool = False,
+    chunksize: Optional[int] = None,
+    sales_path: Optional[str] = None,
     debug: bool = False,
 ) -> None:
     """Main function
@@ -294,6 +299,15 @@ def main(
         orders_url (str): URL to the orders data on Yandex Disk
         model_path (str): Local path of production model
         test_days (int): Number of test days for the model evaluation.
+        warm_start (bool, optional): Update the model saved at model_path
+            with MultiTargetModel.partial_fit instead of fitting from scratch.
+            Defaults to False.
+        chunksize (int, optional): Read the orders CSV in chunks of this
+            many rows, aggregating them into daily sales on the fly.
+            Defaults to None (the whole file is read at once).
+        sales_path (str, optional): Local path of the sales grid kept between
+            runs. When it exists, only days after its end are appended.
+            Defaults to None (the grid is rebuilt from all orders).
         debug (bool, optional): Run the pipeline in debug mode.
             In debug mode no Tasks are created, so it is running faster.
             Defaults to False.
@@ -316,6 +330,11 @@ def main(
         targets=config['targets'],
         quantiles=config['quantiles'],
         horizons=config['horizons'],
+        fit_params=config['fit_params'],
+        warm_start=warm_start,
+        chunksize=chunksize,
+        cache=config['cache'],
+        sales_path=sales_path,
     )
 
 